@@ -0,0 +1,97 @@
+"""
+Measure Job.to_api for the examples/M1 nominal operating point, the number
+of interned units behind it, and the rate and size of Quantity and
+NameQuantityPair objects.
+
+    python benchmarks/data_model.py [repeats]
+"""
+import importlib.util
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from tinarm.api import NameQuantityPair, Quantity, Unit
+from tinarm.helpers import Job, Machine
+
+M1 = os.path.join(ROOT, "examples", "M1")
+OBJECTS = 10000
+
+
+def load_module(filename):
+    spec = importlib.util.spec_from_file_location(os.path.basename(filename)[:-3], filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def m1_job():
+    machine = load_module(os.path.join(M1, "machine.py"))
+    operating_point = load_module(
+        os.path.join(M1, "Nominal_24Nm_2060rpm", "operating_point.py")
+    )
+    q = machine.q
+    simulation = {
+        "samples_per_electrical_period": 180 * q.count / q.turn,
+        "timestep_intervals": 180 * q.count,
+        "active_length": 65 * q.mm * 0.97,
+    }
+    return Job(
+        Machine(
+            machine.stator_parameters,
+            machine.rotor_parameters,
+            machine.winding_parameters,
+        ),
+        operating_point.operating_point,
+        simulation,
+        title="benchmark",
+    )
+
+
+def rate(func, repeats):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return repeats / (time.perf_counter() - start)
+
+
+def bytes_per_object(factory):
+    """
+    Traced allocation per object, including everything it allocates such as
+    a Quantity's magnitude, shape and unit lists, but not the interned units
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory(i) for i in range(OBJECTS)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return (after - before) / OBJECTS
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    job = m1_job()
+    values = len(job.to_api()["data"])
+
+    jobs_per_sec = rate(job.to_api, repeats)
+    print(f"Job.to_api: {jobs_per_sec:,.0f} jobs/s, {jobs_per_sec * values:,.0f} values/s ({values} values per job)")
+
+    # Units are interned, so a Unit costs nothing per Quantity beyond its list slot
+    interned = len(Unit._interned)
+    lookups_per_sec = rate(lambda: [Unit("meter", 1) for _ in range(1000)], repeats // 20) * 1000
+    print(f"Unit: {interned} interned after encoding M1, {lookups_per_sec:,.0f} lookups/s")
+
+    unit = Unit("meter", 1)
+    factories = {
+        "Quantity": lambda i: Quantity(float(i), [unit]),
+        "NameQuantityPair": lambda i: NameQuantityPair("stator", "bore", Quantity(float(i), [unit])),
+    }
+    print(f"{'object':<20}{'objects/s':>14}{'bytes/object':>14}")
+    for name, factory in factories.items():
+        objects_per_sec = rate(lambda: [factory(i) for i in range(1000)], repeats // 20) * 1000
+        print(f"{name:<20}{objects_per_sec:>14,.0f}{bytes_per_object(factory):>14.0f}")
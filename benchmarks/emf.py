@@ -0,0 +1,47 @@
+"""
+Compare examples/phase_a_emf.py with tinarm.HarmonicSeries for large angle arrays.
+
+    python benchmarks/emf.py [samples]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "examples"))
+
+from phase_a_emf import phase_a_emf
+from tinarm.emf import HarmonicSeries
+
+COEFS = [289.9341340734401, -14.335636107475295, -4.52127456374362, -0.8251917704523074, -0.6190003165036551, 0.5214007181887201, -0.700596662395331, 0.38357797784434583, -0.04524750001756496, 0.36765961778576295, -0.0588205471134903, -0.03211240679950895]
+PHASE_EMF_A = -0.043452043822181485
+
+
+def measure(name, func, repeats=3):
+    func()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    elapsed = (time.perf_counter() - start) / repeats
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<44}{elapsed * 1000:>10.1f} ms{peak / 2**20:>10.1f} MiB peak")
+
+
+if __name__ == "__main__":
+    samples = int(float(sys.argv[1])) if len(sys.argv) > 1 else 1000000
+    theta = np.linspace(0, 2 * np.pi, samples, endpoint=False)
+    emf = HarmonicSeries(COEFS, phase=PHASE_EMF_A, pole_pairs=5)
+    emf3 = HarmonicSeries(COEFS, phase=PHASE_EMF_A, pole_pairs=5, phases=3)
+
+    print(f"{samples} angles, {len(COEFS)} harmonics")
+    measure("example phase_a_emf, phase A", lambda: phase_a_emf(theta))
+    measure("example phase_a_emf, 3 phases", lambda: [phase_a_emf(theta - 2 * np.pi * j / 15) for j in range(3)])
+    measure("HarmonicSeries.evaluate, phase A", lambda: emf(theta))
+    measure("HarmonicSeries.evaluate, 3 phases", lambda: emf3(theta))
+    measure("HarmonicSeries.evaluate_uniform, 3 phases", lambda: emf3.evaluate_uniform(samples))
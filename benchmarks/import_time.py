@@ -0,0 +1,37 @@
+"""
+Measure the wall time of importing tinarm in a fresh interpreter.
+
+    python benchmarks/import_time.py [repeats]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+STATEMENTS = {
+    "python": "pass",
+    "import tinarm": "import tinarm",
+    "tinarm.Api, tinarm.Job": "import tinarm; tinarm.Api; tinarm.Job",
+    "tinarm.StandardWorker": "import tinarm; tinarm.StandardWorker",
+}
+
+
+def time_statement(statement, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, "-c", statement], cwd=ROOT)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    baseline = time_statement(STATEMENTS["python"], repeats)
+    print(f"{'statement':<28}{'median ms':>12}{'over python ms':>16}")
+    for name, statement in STATEMENTS.items():
+        elapsed = time_statement(statement, repeats)
+        print(f"{name:<28}{elapsed * 1000:>12.1f}{(elapsed - baseline) * 1000:>16.1f}")
@@ -10,10 +10,12 @@ setuptools.setup(
     license="MIT",
     packages=["tinarm"],
     install_requires=[
+        "numpy",
         "pika",
         "python_logging_rabbitmq",
         "requests",
     ],
+    extras_require={"zstd": ["zstandard"]},
     classifiers=[
         "Development Status :: 2 - Pre-Alpha",
         "Intended Audience :: Science/Research",
@@ -5,6 +5,8 @@ pip install .
 MODULE_VERSION=$(pip show tinarm | grep Version: | grep -Eo "([0-9]{1,}\.)+[0-9]{1,}")
 echo "##teamcity[buildNumber '$MODULE_VERSION.%build.counter%']"
 pip install -r ./tests/requirements.txt
-python3 ./tests/test_api.py
+status=0
+for test in ./tests/test_*.py; do python3 $test || status=1; done
 deactivate
-rm -rf testenv/
\ No newline at end of file
+rm -rf testenv/
+exit $status
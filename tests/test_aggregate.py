@@ -0,0 +1,122 @@
+import mock
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+import requests
+from teamcity import is_running_under_teamcity
+from teamcity.unittestpy import TeamcityTestRunner
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import tinarm
+from tinarm.api import JOB_STATUS
+
+
+def _job(job_id, speed, torque, status="Complete"):
+    def pair(section, name, value, unit):
+        return tinarm.NameQuantityPair(
+            section, name, tinarm.Quantity(value, [tinarm.Unit(unit, 1)])
+        ).to_dict()
+
+    return {
+        "id": job_id,
+        "status": JOB_STATUS[status],
+        "data": [
+            pair("operating_point", "simulated_speed", speed, "revolutions_per_minute"),
+            pair("results", "torque", torque, "newton_meter"),
+            pair("results", "flux", [1.0, 2.0], "weber"),
+        ],
+    }
+
+
+class SweepAggregatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.jobs = {str(i): _job(str(i), 1000.0 * i, 10.0 + i) for i in range(5)}
+        self.jobs["4"] = _job("4", 4000.0, 0.0, status="Solving")
+        self.api = mock.Mock()
+        self.api.get_job.side_effect = lambda job_id: self.jobs[job_id]
+        self.path = os.path.join(tempfile.mkdtemp(), "sweep")
+        self.aggregator = tinarm.SweepAggregator(
+            self.api,
+            self.path,
+            {"torque": ("results", "torque"), "flux": ("results", "flux")},
+            max_workers=2,
+        )
+
+    def test_table(self):
+        self.assertEqual(self.aggregator.update(list(self.jobs)), 5)
+
+        table = tinarm.SweepTable(self.path)
+        self.assertEqual(len(table), 5)
+        self.assertIsInstance(table["torque"], np.memmap)
+        self.assertEqual(list(table["job_id"]), ["0", "1", "2", "3", "4"])
+        np.testing.assert_array_equal(table["simulated_speed"], [0, 1000, 2000, 3000, 4000])
+        np.testing.assert_array_equal(table["torque"], [10, 11, 12, 13, 0])
+        # Only scalars are aggregated
+        self.assertTrue(np.isnan(table["flux"]).all())
+
+    def test_incremental_update(self):
+        self.aggregator.update(list(self.jobs))
+        self.api.get_job.reset_mock()
+
+        self.jobs["4"] = _job("4", 4000.0, 14.0)
+        self.jobs["5"] = _job("5", 5000.0, 15.0)
+        self.assertEqual(self.aggregator.update(list(self.jobs)), 2)
+        self.assertEqual(
+            sorted(c.args[0] for c in self.api.get_job.call_args_list), ["4", "5"]
+        )
+
+        table = tinarm.SweepTable(self.path)
+        np.testing.assert_array_equal(table["torque"], [10, 11, 12, 13, 14, 15])
+        self.assertEqual(self.aggregator.update(list(self.jobs)), 0)
+
+    def test_new_column_refetches(self):
+        self.aggregator.update(list(self.jobs))
+        aggregator = tinarm.SweepAggregator(
+            self.api, self.path, {"torque_2": ("results", "torque")}
+        )
+        self.assertEqual(aggregator.update(list(self.jobs)), 5)
+        np.testing.assert_array_equal(
+            tinarm.SweepTable(self.path)["torque_2"], [10, 11, 12, 13, 0]
+        )
+
+    def test_missing_value_not_refetched(self):
+        self.jobs["3"]["data"] = self.jobs["3"]["data"][:1]
+        self.aggregator.update(list(self.jobs))
+        self.assertTrue(np.isnan(tinarm.SweepTable(self.path)["torque"][3]))
+
+        # Job 3 is complete, its missing torque does not make it stale
+        self.assertEqual(self.aggregator.update(list(self.jobs)), 1)
+        self.assertEqual(self.api.get_job.call_args.args[0], "4")
+
+    def test_failed_job_skipped(self):
+        def get_job(job_id):
+            if job_id == "2":
+                raise requests.exceptions.HTTPError("503 Server Error")
+            return self.jobs[job_id]
+
+        self.api.get_job.side_effect = get_job
+        self.assertEqual(self.aggregator.update(list(self.jobs)), 4)
+        self.assertEqual(
+            list(tinarm.SweepTable(self.path)["job_id"]), ["0", "1", "3", "4"]
+        )
+
+        # The failed job is fetched by the next update
+        self.api.get_job.side_effect = lambda job_id: self.jobs[job_id]
+        self.assertEqual(self.aggregator.update(list(self.jobs)), 2)
+        self.assertEqual(len(tinarm.SweepTable(self.path)), 5)
+
+    def test_empty_table(self):
+        table = tinarm.SweepTable(self.path)
+        self.assertEqual(len(table), 0)
+        self.assertEqual(table.rows(), {})
+
+
+if __name__ == "__main__":
+    if is_running_under_teamcity():
+        runner = TeamcityTestRunner()
+    else:
+        runner = unittest.TextTestRunner()
+    unittest.main(testRunner=runner)
@@ -136,6 +136,124 @@ class ApiTestCase(unittest.TestCase):
             url=f"{ROOT_URL}/jobs/{JOB_ID}/artifacts/{JOB_ARTIFACT_ID}/promote?apikey={API_KEY}",
         )
 
+    @mock.patch("tinarm.api.requests")
+    def test_get_job_cached(self, mock_requests):
+        cached_api = tinarm.Api(root_url=ROOT_URL, api_key=API_KEY, cache_ttl=60)
+        mock_requests.get.return_value.status_code = 200
+        mock_requests.get.return_value.headers = {"ETag": '"v1"'}
+        mock_requests.get.return_value.json.return_value = {"id": JOB_ID}
+
+        self.assertEqual(cached_api.get_job(JOB_ID), {"id": JOB_ID})
+        self.assertEqual(cached_api.get_job(JOB_ID), {"id": JOB_ID})
+
+        self.assertEqual(mock_requests.get.call_count, 1)
+        self.assertEqual(cached_api.cache_stats()["hits"], 1)
+        self.assertEqual(cached_api.cache_stats()["misses"], 1)
+
+    @mock.patch("tinarm.api.requests")
+    def test_get_job_revalidated(self, mock_requests):
+        cached_api = tinarm.Api(root_url=ROOT_URL, api_key=API_KEY, cache_ttl=0)
+        mock_requests.get.return_value.status_code = 200
+        mock_requests.get.return_value.headers = {"ETag": '"v1"'}
+        mock_requests.get.return_value.json.return_value = {"id": JOB_ID}
+        cached_api.get_job(JOB_ID)
+
+        mock_requests.get.return_value.status_code = 304
+        self.assertEqual(cached_api.get_job(JOB_ID), {"id": JOB_ID})
+        mock_requests.get.assert_called_with(
+            url=f"{ROOT_URL}/jobs/{JOB_ID}?apikey={API_KEY}",
+            headers={"If-None-Match": '"v1"'},
+        )
+        self.assertEqual(cached_api.cache_stats()["revalidations"], 1)
+
+    @mock.patch("tinarm.api.requests")
+    def test_get_job_invalidated_during_revalidation(self, mock_requests):
+        cached_api = tinarm.Api(root_url=ROOT_URL, api_key=API_KEY, cache_ttl=0)
+        mock_requests.get.return_value.status_code = 200
+        mock_requests.get.return_value.headers = {"ETag": '"v1"'}
+        mock_requests.get.return_value.json.return_value = {"id": JOB_ID}
+        cached_api.get_job(JOB_ID)
+
+        # Another thread updates the job between the lookup and the 304
+        full = mock.Mock(status_code=200, headers={"ETag": '"v2"'})
+        full.json.return_value = {"id": JOB_ID, "status": 70}
+        responses = iter([mock.Mock(status_code=304), full])
+
+        def get(**kwargs):
+            cached_api._invalidate_job(JOB_ID)
+            return next(responses)
+
+        mock_requests.get.side_effect = get
+        self.assertEqual(cached_api.get_job(JOB_ID), {"id": JOB_ID, "status": 70})
+        mock_requests.get.assert_called_with(
+            url=f"{ROOT_URL}/jobs/{JOB_ID}?apikey={API_KEY}"
+        )
+
+    @mock.patch("tinarm.api.requests")
+    def test_get_job_cache_invalidated(self, mock_requests):
+        cached_api = tinarm.Api(root_url=ROOT_URL, api_key=API_KEY, cache_ttl=60)
+        mock_requests.get.return_value.status_code = 200
+        mock_requests.get.return_value.headers = {}
+        cached_api.get_job(JOB_ID)
+
+        cached_api.update_job_status(JOB_ID, JOB_STATUS)
+        cached_api.get_job(JOB_ID)
+
+        self.assertEqual(mock_requests.get.call_count, 2)
+        mock_requests.get.assert_called_with(
+            url=f"{ROOT_URL}/jobs/{JOB_ID}?apikey={API_KEY}", headers={}
+        )
+
+    @mock.patch("tinarm.api.transfer")
+    @mock.patch("tinarm.api.requests")
+    def test_upload_job_artifact(self, mock_requests, mock_transfer):
+        mock_requests.post.return_value.json.return_value = {"id": JOB_ARTIFACT_ID}
+        api.upload_job_artifact(JOB_ID, JOB_ARTIFACT_TYPE, JOB_ARTIFACT_FILE_PATH)
+        mock_transfer.upload_file.assert_called_with(
+            url=f"{ROOT_URL}/jobs/{JOB_ID}/artifacts/{JOB_ARTIFACT_ID}/content?apikey={API_KEY}",
+            filename=JOB_ARTIFACT_FILE_PATH,
+            chunk_size=mock.ANY,
+            session=None,
+            throttle=None,
+        )
+
+    @mock.patch("tinarm.api.transfer")
+    def test_upload_job_artifact_with_session(self, mock_transfer):
+        session = mock.Mock()
+        session.post.return_value = mock.Mock(
+            status_code=201, **{"json.return_value": {"id": JOB_ARTIFACT_ID}}
+        )
+        throttle = tinarm.Throttle()
+        session_api = tinarm.Api(ROOT_URL, API_KEY, NODE_ID, session=session, throttle=throttle)
+        session_api.upload_job_artifact(JOB_ID, JOB_ARTIFACT_TYPE, JOB_ARTIFACT_FILE_PATH)
+        self.assertIs(mock_transfer.upload_file.call_args.kwargs["session"], session)
+        self.assertIs(mock_transfer.upload_file.call_args.kwargs["throttle"], throttle)
+
+    @mock.patch("tinarm.api.transfer")
+    @mock.patch("tinarm.api.requests")
+    def test_download_job_artifact(self, mock_requests, mock_transfer):
+        mock_requests.get.return_value.json.return_value = {
+            "artifacts": [
+                {
+                    "id": JOB_ARTIFACT_ID,
+                    "url": JOB_ARTIFACT_REMOTE_URL,
+                    "checksum": "sha256:00",
+                }
+            ]
+        }
+        api.download_job_artifact(JOB_ID, JOB_ARTIFACT_ID, "/tmp/test_plot.png")
+        mock_transfer.download_file.assert_called_with(
+            JOB_ARTIFACT_REMOTE_URL,
+            "/tmp/test_plot.png",
+            checksum="sha256:00",
+            workers=mock.ANY,
+            session=None,
+            throttle=None,
+        )
+
+    def test_cache_disabled(self):
+        self.assertIsNone(api.cache_stats())
+
     def test_tae_model(self):
         jobdata = tinarm.NameQuantityPair(
             "section",
@@ -173,6 +291,31 @@ class ApiTestCase(unittest.TestCase):
         with self.assertRaises(ValueError):
             tinarm.Quantity([42, 43], [tinarm.Unit("millimeter", 2)], [2, 2])
 
+    def test_Unit_interned(self):
+        import pickle
+
+        unit = tinarm.Unit("millimeter", 2)
+        self.assertIs(tinarm.Unit("millimeter", 2), unit)
+        self.assertIsNot(tinarm.Unit("millimeter", 2.0), unit)
+        # Each dict is a copy, changing one does not change the interned unit
+        unit.to_dict()["name"] = "foot"
+        self.assertEqual(tinarm.Unit("millimeter", 2).to_dict()["name"], "millimeter")
+        self.assertEqual(unit.to_dict(), {"name": "millimeter", "exponent": 2})
+        self.assertIs(pickle.loads(pickle.dumps(unit)), unit)
+
+    def test_Unit_immutable(self):
+        unit = tinarm.Unit("millimeter", 2)
+        with self.assertRaises(AttributeError):
+            unit.exponent = 3
+        with self.assertRaises(AttributeError):
+            unit.symbol = "mm"
+
+    def test_Quantity_slots(self):
+        q = tinarm.Quantity(42, [("millimeter", 2)])
+        self.assertFalse(hasattr(q, "__dict__"))
+        self.assertIs(q.units[0], tinarm.Unit("millimeter", 2))
+        self.assertFalse(hasattr(tinarm.NameQuantityPair("s", "n", q), "__dict__"))
+
     def test_tae_model_from_pint(self):
         """
         Test case for the `tae_model_from_pint` method.
@@ -0,0 +1,78 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import numpy as np
+from teamcity import is_running_under_teamcity
+from teamcity.unittestpy import TeamcityTestRunner
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import tinarm
+from tinarm import checkpoint
+
+
+class CheckpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.state = {"step": 12, "field": np.arange(1000.0)}
+
+    def _assert_state(self, state):
+        self.assertEqual(state["step"], 12)
+        np.testing.assert_array_equal(state["field"], self.state["field"])
+
+    def test_save_and_load(self):
+        c = tinarm.Checkpoint(self.directory, "solver")
+        self.assertFalse(c.exists())
+        self.assertIsNone(c.load())
+        self.assertEqual(c.load(default={}), {})
+
+        c.save(self.state)
+        self.assertTrue(c.exists())
+        self.assertEqual(
+            c.filename, os.path.join(self.directory, "checkpoints", "solver.ckpt")
+        )
+        self._assert_state(c.load())
+        self.assertEqual(os.listdir(os.path.dirname(c.filename)), ["solver.ckpt"])
+
+    def test_compressed(self):
+        c = tinarm.Checkpoint(self.directory, "solver", compress=True)
+        c.save(self.state)
+        with open(c.filename, "rb") as f:
+            self.assertEqual(f.read(2), checkpoint.CHECKPOINT_GZIP_MAGIC)
+
+        # Compression is detected when loading
+        self._assert_state(tinarm.Checkpoint(self.directory, "solver").load())
+
+    def test_save_replaces(self):
+        c = tinarm.Checkpoint(self.directory, "solver")
+        c.save({"step": 1})
+        c.save({"step": 2})
+        self.assertEqual(c.load(), {"step": 2})
+
+    def test_clear(self):
+        c = tinarm.Checkpoint(self.directory, "solver")
+        c.clear()
+        c.save(self.state)
+        c.clear()
+        self.assertFalse(c.exists())
+
+    def test_check(self):
+        draining = threading.Event()
+        c = tinarm.Checkpoint(self.directory, "solver", draining=draining)
+        c.check(self.state)
+        self.assertFalse(c.exists())
+
+        draining.set()
+        with self.assertRaises(tinarm.JobInterrupted):
+            c.check(self.state)
+        self._assert_state(c.load())
+
+
+if __name__ == "__main__":
+    if is_running_under_teamcity():
+        runner = TeamcityTestRunner()
+    else:
+        runner = unittest.TextTestRunner()
+    unittest.main(testRunner=runner)
@@ -0,0 +1,76 @@
+import os
+import sys
+import unittest
+import numpy as np
+from teamcity import is_running_under_teamcity
+from teamcity.unittestpy import TeamcityTestRunner
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../examples")))
+
+import tinarm
+from phase_a_emf import phase_a_emf
+
+COEFS = [289.9341340734401, -14.335636107475295, -4.52127456374362, -0.8251917704523074, -0.6190003165036551, 0.5214007181887201, -0.700596662395331, 0.38357797784434583, -0.04524750001756496, 0.36765961778576295, -0.0588205471134903, -0.03211240679950895]
+PHASE_EMF_A = -0.043452043822181485
+THETA = np.linspace(0, 2 * np.pi, 1000, endpoint=False)
+
+
+def _direct(coefficients, phase, pole_pairs, orders, theta):
+    return np.matmul(coefficients, np.cos(np.outer(orders, phase + theta * pole_pairs)))
+
+
+class HarmonicSeriesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.emf = tinarm.HarmonicSeries(COEFS, phase=PHASE_EMF_A, pole_pairs=5)
+
+    def test_matches_example(self):
+        np.testing.assert_allclose(self.emf(THETA), phase_a_emf(THETA), atol=1e-9)
+        self.assertEqual(self.emf.shape, ())
+
+    def test_chunks(self):
+        np.testing.assert_allclose(
+            self.emf.evaluate(THETA, chunk_size=77), self.emf(THETA), atol=1e-12
+        )
+
+    def test_uniform(self):
+        np.testing.assert_allclose(
+            self.emf.evaluate_uniform(THETA.size), phase_a_emf(THETA), atol=1e-9
+        )
+
+    def test_uniform_too_few_samples(self):
+        with self.assertRaises(ValueError):
+            self.emf.evaluate_uniform(64)
+
+    def test_all_harmonics(self):
+        emf = tinarm.HarmonicSeries([1.0, 0.5, 0.2], phase=0.3, pole_pairs=2, step=1)
+        np.testing.assert_allclose(
+            emf(THETA), _direct([1.0, 0.5, 0.2], 0.3, 2, [1, 2, 3], THETA), atol=1e-12
+        )
+
+    def test_batch_of_operating_points_and_phases(self):
+        coefficients = np.array([COEFS, np.array(COEFS) * 2])
+        emf = tinarm.HarmonicSeries(
+            coefficients, phase=[PHASE_EMF_A, 0.1], pole_pairs=5, phases=3
+        )
+        result = emf(THETA)
+        self.assertEqual(result.shape, (2, 3, THETA.size))
+        self.assertEqual(emf.shape, (2, 3))
+
+        orders = np.arange(1, 2 * len(COEFS), 2)
+        for point, phase in enumerate([PHASE_EMF_A, 0.1]):
+            for j in range(3):
+                expected = _direct(
+                    coefficients[point], phase - 2 * np.pi * j / 3, 5, orders, THETA
+                )
+                np.testing.assert_allclose(result[point, j], expected, atol=1e-9)
+
+        np.testing.assert_allclose(emf.evaluate_uniform(THETA.size), result, atol=1e-9)
+
+
+if __name__ == "__main__":
+    if is_running_under_teamcity():
+        runner = TeamcityTestRunner()
+    else:
+        runner = unittest.TextTestRunner()
+    unittest.main(testRunner=runner)
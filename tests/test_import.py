@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+import unittest
+from teamcity import is_running_under_teamcity
+from teamcity.unittestpy import TeamcityTestRunner
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+
+def _loaded_modules(statement):
+    """Run a statement in a fresh interpreter and return the loaded module names"""
+    output = subprocess.check_output(
+        [sys.executable, "-c", f"import sys; {statement}; print(' '.join(sys.modules))"],
+        cwd=ROOT,
+    )
+    return set(output.decode().split())
+
+
+class LazyImportTestCase(unittest.TestCase):
+    def test_import_is_lightweight(self):
+        modules = _loaded_modules("import tinarm")
+        for heavy in ("pika", "python_logging_rabbitmq", "requests", "ssl", "numpy"):
+            self.assertNotIn(heavy, modules)
+
+    def test_api_does_not_load_worker(self):
+        modules = _loaded_modules("import tinarm; tinarm.Api; tinarm.Job")
+        self.assertIn("tinarm.api", modules)
+        self.assertNotIn("tinarm.worker", modules)
+        self.assertNotIn("pika", modules)
+
+    def test_configure_logging_is_lightweight(self):
+        modules = _loaded_modules("import tinarm; tinarm.configure_logging()")
+        self.assertNotIn("tinarm.worker", modules)
+        for heavy in ("pika", "python_logging_rabbitmq", "ssl", "numpy"):
+            self.assertNotIn(heavy, modules)
+
+    def test_import_does_not_configure_logging(self):
+        output = subprocess.check_output(
+            [
+                sys.executable,
+                "-c",
+                "import logging, tinarm; tinarm.Api; tinarm.StandardWorker; "
+                "print(len(logging.getLogger().handlers))",
+            ],
+            cwd=ROOT,
+        )
+        self.assertEqual(output.decode().strip(), "0")
+
+    def test_unknown_attribute(self):
+        import tinarm
+
+        with self.assertRaises(AttributeError):
+            tinarm.NotAThing
+
+
+if __name__ == "__main__":
+    if is_running_under_teamcity():
+        runner = TeamcityTestRunner()
+    else:
+        runner = unittest.TextTestRunner()
+    unittest.main(testRunner=runner)
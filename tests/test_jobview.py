@@ -0,0 +1,88 @@
+import mock
+import os
+import sys
+import unittest
+import numpy as np
+from teamcity import is_running_under_teamcity
+from teamcity.unittestpy import TeamcityTestRunner
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import tinarm
+
+JOB_ID = "4568"
+
+JOB = {
+    "id": JOB_ID,
+    "status": 70,
+    "data": [
+        tinarm.NameQuantityPair(
+            "operating_point",
+            "simulated_speed",
+            tinarm.Quantity(2060, [tinarm.Unit("revolutions_per_minute", 1)]),
+        ).to_dict(),
+        tinarm.NameQuantityPair(
+            "results",
+            "flux",
+            tinarm.Quantity(np.arange(6.0).reshape(2, 3), [tinarm.Unit("weber", 1)]),
+        ).to_dict(),
+    ],
+    "artifacts": [
+        {"id": "a1", "type": "mesh", "url": "file://node/mesh.msh"},
+        {"id": "a2", "type": "solver_log", "url": "file://node/solver.log"},
+        {"id": "a3", "type": "solver_log", "url": "file://node/post.log"},
+    ],
+}
+
+
+class JobViewTestCase(unittest.TestCase):
+    def setUp(self):
+        self.view = tinarm.JobView(JOB)
+
+    def test_properties(self):
+        self.assertEqual(self.view.id, JOB_ID)
+        self.assertEqual(self.view.status, "Complete")
+        self.assertEqual(len(self.view), 2)
+
+    def test_data(self):
+        flux = self.view["results", "flux"]
+        np.testing.assert_array_equal(flux, np.arange(6.0).reshape(2, 3))
+        self.assertIs(self.view["results", "flux"], flux)
+        self.assertFalse(flux.flags.writeable)
+
+        self.assertEqual(self.view["operating_point", "simulated_speed"].shape, (1,))
+        self.assertIn(("results", "flux"), self.view)
+        self.assertIsNone(self.view.get("results", "torque"))
+        self.assertEqual(self.view.names("results"), ["flux"])
+
+    def test_decoded_lazily(self):
+        with mock.patch("tinarm.jobview.np.asarray", wraps=np.asarray) as asarray:
+            view = tinarm.JobView(JOB)
+            asarray.assert_not_called()
+            view["results", "flux"]
+            asarray.assert_called_once()
+
+    def test_units(self):
+        units = self.view.units("results", "flux")
+        self.assertEqual([u.to_dict() for u in units], [{"name": "weber", "exponent": 1}])
+
+    def test_artifacts(self):
+        self.assertEqual(self.view.artifact("a1")["type"], "mesh")
+        self.assertEqual(
+            [a["id"] for a in self.view.artifacts("solver_log")], ["a2", "a3"]
+        )
+        self.assertEqual(len(self.view.artifacts()), 3)
+        self.assertEqual(self.view.artifacts("plot"), [])
+
+    def test_from_api(self):
+        api = mock.Mock(**{"get_job.return_value": JOB})
+        self.assertEqual(tinarm.JobView.from_api(api, JOB_ID).id, JOB_ID)
+        api.get_job.assert_called_with(JOB_ID)
+
+
+if __name__ == "__main__":
+    if is_running_under_teamcity():
+        runner = TeamcityTestRunner()
+    else:
+        runner = unittest.TextTestRunner()
+    unittest.main(testRunner=runner)
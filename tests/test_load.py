@@ -0,0 +1,54 @@
+import os
+import sys
+import unittest
+from teamcity import is_running_under_teamcity
+from teamcity.unittestpy import TeamcityTestRunner
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from tinarm.load import CpuMonitor, PrefetchController, available_memory_fraction
+
+
+class PrefetchControllerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.controller = PrefetchController(minimum=1, maximum=4)
+
+    def test_raise_when_saturated_and_idle(self):
+        self.assertEqual(self.controller.decide(2, 2, 0.3, 0.5), (3, False))
+
+    def test_hold_when_not_saturated(self):
+        self.assertEqual(self.controller.decide(2, 1, 0.3, 0.5), (2, False))
+
+    def test_limits(self):
+        self.assertEqual(self.controller.decide(4, 4, 0.3, 0.5), (4, False))
+        self.assertEqual(self.controller.decide(1, 1, 0.95, 0.5), (1, True))
+
+    def test_lower_and_pause_under_memory_pressure(self):
+        self.assertEqual(self.controller.decide(3, 3, 0.3, 0.05), (2, True))
+
+    def test_hysteresis(self):
+        self.assertEqual(self.controller.decide(3, 3, 0.95, 0.5), (2, True))
+        # Between the thresholds the pause is kept and the prefetch held
+        self.assertEqual(self.controller.decide(2, 2, 0.75, 0.5), (2, True))
+        self.assertEqual(self.controller.decide(2, 2, 0.3, 0.5), (3, False))
+
+    def test_unknown_memory(self):
+        self.assertEqual(self.controller.decide(2, 2, 0.3, None), (3, False))
+
+    def test_invalid_range(self):
+        with self.assertRaises(ValueError):
+            PrefetchController(minimum=4, maximum=2)
+
+    def test_monitors(self):
+        self.assertGreaterEqual(CpuMonitor().utilisation(), 0.0)
+        memory = available_memory_fraction()
+        if memory is not None:
+            self.assertTrue(0.0 < memory <= 1.0)
+
+
+if __name__ == "__main__":
+    if is_running_under_teamcity():
+        runner = TeamcityTestRunner()
+    else:
+        runner = unittest.TextTestRunner()
+    unittest.main(testRunner=runner)
@@ -0,0 +1,95 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+from teamcity import is_running_under_teamcity
+from teamcity.unittestpy import TeamcityTestRunner
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import tinarm
+
+JOB_ID = "4568"
+
+
+class PayloadStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.projects_path = tempfile.mkdtemp()
+        self.store = tinarm.PayloadStore(self.projects_path, threshold=1024)
+        self.payload_directory = os.path.join(
+            self.projects_path, "jobs", JOB_ID, "payloads"
+        )
+
+    def test_put_get(self):
+        start = np.random.rand(20, 30)
+        ref = self.store.put(JOB_ID, "field", start)
+
+        self.assertEqual(ref["$payload"]["shape"], [20, 30])
+        self.assertEqual(ref["$payload"]["dtype"], start.dtype.str)
+
+        mapped = self.store.get(json.loads(json.dumps(ref)), verify=True)
+        self.assertIsInstance(mapped, np.memmap)
+        np.testing.assert_array_equal(mapped, start)
+
+    def test_checksum_mismatch(self):
+        ref = self.store.put(JOB_ID, "field", np.arange(10.0))
+        ref["$payload"]["checksum"] = "sha256:0"
+        with self.assertRaises(ValueError):
+            self.store.get(ref, verify=True)
+
+    def test_pack_unpack(self):
+        body = {"id": JOB_ID, "mesh": np.ones((100, 3)), "small": np.ones(2)}
+        packed = self.store.pack(JOB_ID, body)
+
+        self.assertIn("$payload", packed["mesh"])
+        self.assertEqual(packed["small"], [1.0, 1.0])
+
+        unpacked = self.store.unpack(json.loads(json.dumps(packed)))
+        np.testing.assert_array_equal(unpacked["mesh"], body["mesh"])
+        self.assertEqual(unpacked["small"], [1.0, 1.0])
+
+    def test_cleanup_waits_for_release(self):
+        ref = self.store.put(JOB_ID, "field", np.arange(1000.0))
+        self.store.get(ref)
+
+        self.store.cleanup(JOB_ID)
+        self.assertTrue(os.path.isdir(self.payload_directory))
+
+        self.store.release(ref)
+        self.assertFalse(os.path.isdir(self.payload_directory))
+
+    def test_get_while_removing(self):
+        ref = self.store.put(JOB_ID, "field", np.arange(1000.0))
+        self.store._removing.add(JOB_ID)
+        with self.assertRaises(FileNotFoundError):
+            self.store.get(ref)
+        self.assertNotIn(JOB_ID, self.store._open)
+
+    def test_unreleased_references_expire(self):
+        store = tinarm.PayloadStore(self.projects_path, threshold=1024, release_timeout=0)
+        ref = store.put(JOB_ID, "field", np.arange(1000.0))
+        store.get(ref)
+
+        store.cleanup(JOB_ID)
+        self.assertTrue(os.path.isdir(self.payload_directory))
+
+        # The next job's cleanup gives up on the reference that was never released
+        with self.assertLogs("tinarm.payload", "WARNING"):
+            store.cleanup("4569")
+        self.assertFalse(os.path.isdir(self.payload_directory))
+        self.assertEqual(store._open, {})
+
+    def test_cleanup(self):
+        self.store.put(JOB_ID, "field", np.arange(1000.0))
+        self.store.cleanup(JOB_ID)
+        self.assertFalse(os.path.isdir(self.payload_directory))
+
+
+if __name__ == "__main__":
+    if is_running_under_teamcity():
+        runner = TeamcityTestRunner()
+    else:
+        runner = unittest.TextTestRunner()
+    unittest.main(testRunner=runner)
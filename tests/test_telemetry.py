@@ -0,0 +1,61 @@
+import mock
+import os
+import sys
+import tempfile
+import unittest
+from teamcity import is_running_under_teamcity
+from teamcity.unittestpy import TeamcityTestRunner
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from tinarm.telemetry import ResourceUsage, telemetry_section
+
+
+class ResourceUsageTestCase(unittest.TestCase):
+    def test_measurements(self):
+        directory = tempfile.mkdtemp()
+        with ResourceUsage(directory) as usage:
+            sum(i * i for i in range(100000))
+            with open(os.path.join(directory, "out.bin"), "wb") as f:
+                f.write(b"\0" * 4096)
+
+        self.assertGreater(usage.wall_time, 0)
+        self.assertGreater(usage.cpu_time, 0)
+        self.assertGreater(usage.process_peak_rss, 0)
+        self.assertEqual(usage.directory_growth, 4096)
+
+    def test_to_name_quantity_pairs(self):
+        with ResourceUsage() as usage:
+            pass
+
+        pairs = {p.name: p.to_dict() for p in usage.to_name_quantity_pairs()}
+        self.assertNotIn("directory_growth", pairs)
+        self.assertEqual(pairs["wall_time"]["section"], "telemetry")
+        self.assertEqual(
+            pairs["wall_time"]["value"]["units"], [{"name": "second", "exponent": 1}]
+        )
+        self.assertEqual(
+            pairs["process_peak_rss"]["value"]["units"], [{"name": "byte", "exponent": 1}]
+        )
+
+    def test_stage_section(self):
+        with ResourceUsage() as usage:
+            pass
+
+        pairs = usage.to_name_quantity_pairs(telemetry_section("solver"))
+        self.assertTrue(all(p.section == "telemetry_solver" for p in pairs))
+
+    def test_no_directory_not_walked(self):
+        with mock.patch("tinarm.telemetry._directory_size") as mock_size:
+            with ResourceUsage() as usage:
+                pass
+        mock_size.assert_not_called()
+        self.assertIsNone(usage.directory_growth)
+
+
+if __name__ == "__main__":
+    if is_running_under_teamcity():
+        runner = TeamcityTestRunner()
+    else:
+        runner = unittest.TextTestRunner()
+    unittest.main(testRunner=runner)
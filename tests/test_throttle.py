@@ -0,0 +1,191 @@
+import mock
+import os
+import sys
+import unittest
+import requests
+from teamcity import is_running_under_teamcity
+from teamcity.unittestpy import TeamcityTestRunner
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import tinarm
+from tinarm import throttle
+
+
+def _response(status_code, retry_after=None):
+    headers = {} if retry_after is None else {"Retry-After": retry_after}
+    return mock.Mock(status_code=status_code, headers=headers)
+
+
+@mock.patch("tinarm.throttle.time.sleep")
+class ThrottleTestCase(unittest.TestCase):
+    def test_success(self, mock_sleep):
+        t = throttle.Throttle()
+        response = t.request("data", lambda: _response(200))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(t.stats()["data"]["successes"], 1)
+        self.assertEqual(t.stats()["data"]["circuit"], "closed")
+
+    def test_retry_after_seconds(self, mock_sleep):
+        t = throttle.Throttle()
+        send = mock.Mock(side_effect=[_response(429, "3"), _response(200)])
+        self.assertEqual(t.request("status", send).status_code, 200)
+        mock_sleep.assert_called_once_with(3.0)
+        self.assertEqual(t.stats()["status"]["retries"], 1)
+
+    def test_retry_after_longer_than_max_wait(self, mock_sleep):
+        t = throttle.Throttle(max_wait=60)
+        send = mock.Mock(side_effect=[_response(429, "3600"), _response(200)])
+        with self.assertRaises(throttle.CircuitOpenError):
+            t.request("status", send)
+        mock_sleep.assert_not_called()
+        self.assertEqual(t.stats()["status"]["rejected"], 1)
+
+    def test_retry_after_waits_add_up(self, mock_sleep):
+        t = throttle.Throttle(max_wait=60)
+        send = mock.Mock(side_effect=[_response(503, "40"), _response(503, "40")])
+        with self.assertRaises(throttle.CircuitOpenError):
+            t.request("status", send)
+        mock_sleep.assert_called_once_with(40.0)
+
+    def test_retry_after_date(self, mock_sleep):
+        response = _response(503, "Wed, 21 Oct 2015 07:28:00 GMT")
+        self.assertEqual(throttle._retry_after(response), 0.0)
+        self.assertIsNone(throttle._retry_after(_response(503, "soon")))
+
+    def test_backoff_without_retry_after(self, mock_sleep):
+        t = throttle.Throttle()
+        send = mock.Mock(
+            side_effect=[_response(502), _response(502), _response(200)]
+        )
+        t.request("artifacts", send)
+        self.assertEqual(
+            [c.args[0] for c in mock_sleep.call_args_list],
+            [throttle.THROTTLE_FIRST_BACKOFF_SECS, 2 * throttle.THROTTLE_FIRST_BACKOFF_SECS],
+        )
+
+    def test_retry_connection_error(self, mock_sleep):
+        t = throttle.Throttle()
+        send = mock.Mock(
+            side_effect=[requests.exceptions.ConnectionError(), _response(200)]
+        )
+        self.assertEqual(t.request("data", send).status_code, 200)
+
+    def test_no_retry_of_non_idempotent_server_error(self, mock_sleep):
+        t = throttle.Throttle()
+        send = mock.Mock(return_value=_response(502))
+        self.assertEqual(t.request("data", send, idempotent=False).status_code, 502)
+        send.assert_called_once()
+
+    def test_retries_exhausted(self, mock_sleep):
+        t = throttle.Throttle(max_retries=2, failure_threshold=10)
+        send = mock.Mock(return_value=_response(503))
+        self.assertEqual(t.request("data", send).status_code, 503)
+        self.assertEqual(send.call_count, 3)
+        self.assertEqual(t.stats()["data"]["failures"], 3)
+
+    def test_client_errors_are_not_retried(self, mock_sleep):
+        t = throttle.Throttle()
+        send = mock.Mock(return_value=_response(404))
+        self.assertEqual(t.request("jobs", send).status_code, 404)
+        send.assert_called_once()
+        self.assertEqual(t.stats()["jobs"]["failures"], 0)
+
+    def test_circuit_opens(self, mock_sleep):
+        t = throttle.Throttle(failure_threshold=2, max_retries=1, max_wait=0)
+        send = mock.Mock(return_value=_response(503))
+        t.request("artifacts", send)
+        self.assertEqual(t.stats()["artifacts"]["circuit"], "open")
+        self.assertEqual(t.stats()["artifacts"]["circuit_opened"], 1)
+
+        with self.assertRaises(throttle.CircuitOpenError):
+            t.request("artifacts", send)
+        self.assertEqual(send.call_count, 2)
+        self.assertEqual(t.stats()["artifacts"]["rejected"], 1)
+
+        # Other endpoint classes are unaffected
+        t.request("status", lambda: _response(200))
+
+    def test_circuit_closes_after_probe(self, mock_sleep):
+        with mock.patch("tinarm.throttle.time.monotonic") as mock_monotonic:
+            mock_monotonic.return_value = 0.0
+            t = throttle.Throttle(failure_threshold=1, max_retries=0, reset_timeout=10)
+            t.request("data", lambda: _response(503))
+            self.assertEqual(t.stats()["data"]["circuit"], "open")
+
+            mock_monotonic.return_value = 11.0
+            t.request("data", lambda: _response(200))
+            self.assertEqual(t.stats()["data"]["circuit"], "closed")
+
+    def test_probe_raising_reopens_circuit(self, mock_sleep):
+        with mock.patch("tinarm.throttle.time.monotonic") as mock_monotonic:
+            mock_monotonic.return_value = 0.0
+            t = throttle.Throttle(failure_threshold=1, max_retries=0, reset_timeout=10)
+            t.request("data", lambda: _response(503))
+
+            mock_monotonic.return_value = 11.0
+            send = mock.Mock(side_effect=requests.exceptions.ChunkedEncodingError())
+            with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+                t.request("data", send)
+            self.assertEqual(t.stats()["data"]["circuit"], "open")
+
+            # A later probe is let through once the reset timeout has passed again
+            mock_monotonic.return_value = 22.0
+            self.assertEqual(t.request("data", lambda: _response(200)).status_code, 200)
+            self.assertEqual(t.stats()["data"]["circuit"], "closed")
+
+    def test_circuit_waits_before_probe(self, mock_sleep):
+        with mock.patch("tinarm.throttle.time.monotonic") as mock_monotonic:
+            mock_monotonic.return_value = 0.0
+            mock_sleep.side_effect = lambda secs: setattr(
+                mock_monotonic, "return_value", mock_monotonic.return_value + secs
+            )
+            t = throttle.Throttle(failure_threshold=1, max_retries=0, reset_timeout=5)
+            t.request("data", lambda: _response(503))
+            self.assertEqual(t.request("data", lambda: _response(200)).status_code, 200)
+            mock_sleep.assert_called_once_with(5.0)
+
+
+class TokenBucketTestCase(unittest.TestCase):
+    @mock.patch("tinarm.throttle.time.sleep")
+    @mock.patch("tinarm.throttle.time.monotonic", return_value=0.0)
+    def test_rate(self, mock_monotonic, mock_sleep):
+        bucket = throttle.TokenBucket(rate=10.0, capacity=2)
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertEqual(bucket.acquire(), 0)
+
+        mock_sleep.side_effect = lambda secs: setattr(
+            mock_monotonic, "return_value", mock_monotonic.return_value + secs
+        )
+        self.assertAlmostEqual(bucket.acquire(), 0.1)
+
+
+class ApiThrottleTestCase(unittest.TestCase):
+    @mock.patch("tinarm.throttle.time.sleep")
+    @mock.patch("tinarm.api.requests")
+    def test_api_retries_through_throttle(self, mock_requests, mock_sleep):
+        api = tinarm.Api("https://api.example.com", "1234", throttle=tinarm.Throttle())
+        mock_requests.put.side_effect = [
+            _response(429, "1"),
+            mock.Mock(status_code=200, **{"json.return_value": {"status": 40}}),
+        ]
+        self.assertEqual(api.update_job_status("1", 40), {"status": 40})
+        self.assertEqual(mock_requests.put.call_count, 2)
+        self.assertEqual(api.throttle_stats()["status"]["retries"], 1)
+
+    @mock.patch("tinarm.api.requests")
+    def test_api_without_throttle(self, mock_requests):
+        api = tinarm.Api("https://api.example.com", "1234")
+        api.get_job("1")
+        mock_requests.get.assert_called_once_with(
+            url="https://api.example.com/jobs/1?apikey=1234"
+        )
+        self.assertIsNone(api.throttle_stats())
+
+
+if __name__ == "__main__":
+    if is_running_under_teamcity():
+        runner = TeamcityTestRunner()
+    else:
+        runner = unittest.TextTestRunner()
+    unittest.main(testRunner=runner)
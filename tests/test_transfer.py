@@ -0,0 +1,165 @@
+import hashlib
+import mock
+import os
+import re
+import sys
+import tempfile
+import unittest
+import requests
+from teamcity import is_running_under_teamcity
+from teamcity.unittestpy import TeamcityTestRunner
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from tinarm import transfer
+
+URL = "https://example.com/artifact"
+CONTENT = os.urandom(100000)
+
+
+def _response(status_code, headers=None, content=b""):
+    response = mock.Mock(status_code=status_code, headers=headers or {})
+    response.iter_content.side_effect = lambda size: (
+        content[i : i + size] for i in range(0, len(content), size)
+    )
+    return response
+
+
+class FakeServer:
+    """Serves CONTENT with range support and accepts resumable uploads"""
+
+    def __init__(self, ranges=True, fail_puts=()):
+        self.ranges = ranges
+        self.received = bytearray()
+        self.fail_puts = fail_puts
+        self.puts = 0
+
+    def head(self, url, allow_redirects):
+        headers = {"Content-Length": str(len(CONTENT))}
+        if self.ranges:
+            headers["Accept-Ranges"] = "bytes"
+        return _response(200, headers)
+
+    def get(self, url, headers=None, stream=False):
+        if headers and self.ranges:
+            start, end = map(int, re.match(r"bytes=(\d+)-(\d+)", headers["Range"]).groups())
+            return _response(206, content=CONTENT[start : end + 1])
+        return _response(200, content=CONTENT)
+
+    def put(self, url, data, headers):
+        self.puts += 1
+        if self.puts in self.fail_puts:
+            raise requests.exceptions.ConnectionError()
+
+        match = re.match(r"bytes (\d+)-(\d+)/(\d+)", headers["Content-Range"])
+        if match:
+            start = int(match.group(1))
+            self.received[start : start + len(data)] = data
+        size = int(headers["Content-Range"].split("/")[1])
+        if len(self.received) == size:
+            return _response(201)
+        if not self.received:
+            return _response(308)
+        return _response(308, {"Range": f"bytes=0-{len(self.received) - 1}"})
+
+
+class TransferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "artifact.bin")
+        self.checksum = "sha256:" + hashlib.sha256(CONTENT).hexdigest()
+
+    def _read(self):
+        with open(self.filename, "rb") as f:
+            return f.read()
+
+    def test_ranged_download(self):
+        transfer.download_file(
+            URL, self.filename, self.checksum, workers=3, chunk_size=7000, session=FakeServer()
+        )
+        self.assertEqual(self._read(), CONTENT)
+
+    def test_download_without_ranges(self):
+        transfer.download_file(URL, self.filename, session=FakeServer(ranges=False))
+        self.assertEqual(self._read(), CONTENT)
+
+    def test_download_checksum_mismatch(self):
+        with self.assertRaises(IOError):
+            transfer.download_file(URL, self.filename, "sha256:00", session=FakeServer())
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_chunked_upload(self):
+        with open(self.filename, "wb") as f:
+            f.write(CONTENT)
+        server = FakeServer()
+        response = transfer.upload_file(URL, self.filename, chunk_size=30000, session=server)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(bytes(server.received), CONTENT)
+        self.assertEqual(server.puts, 5)
+
+    @mock.patch("tinarm.transfer.time.sleep")
+    def test_upload_resumes(self, mock_sleep):
+        with open(self.filename, "wb") as f:
+            f.write(CONTENT)
+        server = FakeServer(fail_puts=(3,))
+        transfer.upload_file(URL, self.filename, chunk_size=30000, session=server)
+        self.assertEqual(bytes(server.received), CONTENT)
+
+    @mock.patch("tinarm.transfer.time.sleep")
+    def test_upload_survives_failed_probes(self, mock_sleep):
+        with open(self.filename, "wb") as f:
+            f.write(CONTENT)
+        # A chunk fails, then so do the next two offset probes while the server is down
+        server = FakeServer(fail_puts=(3, 4, 5))
+        transfer.upload_file(URL, self.filename, chunk_size=30000, session=server)
+        self.assertEqual(bytes(server.received), CONTENT)
+        self.assertEqual([c.args[0] for c in mock_sleep.call_args_list], [0.5, 1.0, 2.0])
+
+    @mock.patch("tinarm.transfer.time.sleep")
+    def test_upload_gives_up(self, mock_sleep):
+        with open(self.filename, "wb") as f:
+            f.write(CONTENT)
+        server = FakeServer(fail_puts=range(2, 100))
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            transfer.upload_file(URL, self.filename, chunk_size=30000, session=server)
+        self.assertEqual(mock_sleep.call_count, transfer.TRANSFER_MAX_RETRIES)
+
+    @mock.patch("tinarm.transfer.time.sleep")
+    def test_upload_empty_file(self, mock_sleep):
+        open(self.filename, "wb").close()
+        server = mock.Mock(**{"put.return_value": _response(201)})
+        transfer.upload_file(URL, self.filename, session=server)
+        server.put.assert_called_once_with(
+            url=URL, data=b"", headers={"X-Content-SHA256": mock.ANY, "Content-Range": "bytes */0"}
+        )
+
+    @mock.patch("tinarm.transfer.time.sleep")
+    def test_upload_never_completed(self, mock_sleep):
+        with open(self.filename, "wb") as f:
+            f.write(CONTENT[:10])
+        # The server has every byte but keeps answering 308
+        server = mock.Mock(**{"put.return_value": _response(308, {"Range": "bytes=0-9"})})
+        with self.assertRaises(IOError):
+            transfer.upload_file(URL, self.filename, session=server)
+        self.assertEqual(server.put.call_count, transfer.TRANSFER_MAX_RETRIES + 1)
+        for call in server.put.call_args_list:
+            self.assertEqual(call.kwargs["headers"]["Content-Range"], "bytes */10")
+
+    def test_upload_through_throttle(self):
+        with open(self.filename, "wb") as f:
+            f.write(CONTENT)
+        server = FakeServer()
+        throttle = mock.Mock(**{"request.side_effect": lambda endpoint, send: send()})
+        transfer.upload_file(
+            URL, self.filename, chunk_size=30000, session=server, throttle=throttle
+        )
+        self.assertEqual(bytes(server.received), CONTENT)
+        self.assertEqual(throttle.request.call_count, server.puts)
+
+
+if __name__ == "__main__":
+    if is_running_under_teamcity():
+        runner = TeamcityTestRunner()
+    else:
+        runner = unittest.TextTestRunner()
+    unittest.main(testRunner=runner)
@@ -0,0 +1,178 @@
+import importlib.util
+import os
+import sys
+import unittest
+import numpy as np
+import pint
+from teamcity import is_running_under_teamcity
+from teamcity.unittestpy import TeamcityTestRunner
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import tinarm
+from tinarm import units
+
+q = pint.UnitRegistry()
+
+M1 = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "examples", "M1"))
+
+
+def _load_module(filename):
+    spec = importlib.util.spec_from_file_location(os.path.basename(filename)[:-3], filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _baseline_data(section, quantities):
+    """The job data Job.to_api sent before unit caching, each quantity in its own units"""
+    return [
+        tinarm.NameQuantityPair(section, k, tinarm.Quantity(*v.to_tuple())).to_dict()
+        for k, v in quantities.items()
+    ]
+
+
+class UnitsTestCase(unittest.TestCase):
+    def _assert_matches_pint(self, quantity):
+        magnitude, si_units = units.to_si(quantity)
+        expected = quantity.to_base_units()
+        np.testing.assert_allclose(magnitude, expected.magnitude)
+        self.assertEqual(
+            [(u.name, u.exponent) for u in si_units],
+            [(n, e) for n, e in expected.unit_items()],
+        )
+
+    def test_matches_pint(self):
+        for quantity in (
+            300 * q.um,
+            8.20 * q.cm,
+            70 * q.degrees,
+            2060 * q.rpm,
+            6.27768442 * q.A * q.mm**-2,
+            42 * q.percent,
+            12 * q.count,
+            q.Quantity(25, "degC"),
+        ):
+            self._assert_matches_pint(quantity)
+
+    def test_array(self):
+        self._assert_matches_pint(np.random.rand(2, 5, 3) * q.mm)
+
+    def test_whole_exponents_are_int(self):
+        _, si_units = units.to_si(6.2 * q.A * q.mm**-2)
+        self.assertEqual(si_units[1].to_dict(), {"name": "meter", "exponent": -2})
+        self.assertIsInstance(si_units[1].exponent, int)
+
+    def test_identity_keeps_magnitude(self):
+        magnitude, _ = units.to_si(12 * q.count)
+        self.assertEqual(magnitude, 12)
+        self.assertIsInstance(magnitude, int)
+
+    def test_conversion_cached(self):
+        units.clear_cache()
+        for length in range(10):
+            units.to_si(length * q.mm)
+        info = units._conversion.cache_info()
+        self.assertEqual(info.misses, 1)
+        self.assertEqual(info.hits, 9)
+
+    def test_to_units(self):
+        quantity = 180 * q.count / q.turn
+        magnitude, own_units = units.to_units(quantity)
+        self.assertEqual(magnitude, 180)
+        self.assertEqual(
+            [(u.name, u.exponent) for u in own_units], list(quantity.to_tuple()[1])
+        )
+
+    def test_units_cached(self):
+        units.clear_cache()
+        for length in range(10):
+            units.to_units(length * q.mm)
+        info = units._units.cache_info()
+        self.assertEqual(info.misses, 1)
+        self.assertEqual(info.hits, 9)
+
+    def test_to_api_quantity(self):
+        quantity = units.to_api_quantity(np.ones((2, 3)) * q.mm).to_dict()
+        self.assertEqual(quantity["magnitude"], [1.0] * 6)
+        self.assertEqual(quantity["units"], [{"name": "millimeter", "exponent": 1}])
+
+    def test_to_api_quantity_si(self):
+        quantity = units.to_api_quantity(np.ones((2, 3)) * q.mm, si=True).to_dict()
+        self.assertEqual(tuple(quantity["shape"]), (2, 3))
+        self.assertEqual(quantity["magnitude"], [0.001] * 6)
+        self.assertEqual(quantity["units"], [{"name": "meter", "exponent": 1}])
+
+    def test_to_api_dict(self):
+        for quantity in (300 * q.um, np.ones((2, 3)) * q.mm, 12 * q.count, 2060 * q.rpm):
+            for si in (False, True):
+                self.assertEqual(
+                    units.to_api_dict(quantity, si),
+                    units.to_api_quantity(quantity, si).to_dict(),
+                )
+
+    def test_to_api_dict_not_shared(self):
+        units.to_api_dict(1 * q.m)["units"][0]["name"] = "foot"
+        self.assertEqual(units.to_api_dict(2 * q.m)["units"], [{"name": "meter", "exponent": 1}])
+
+    def test_to_api_data(self):
+        values = {"stator_bore": 8.20 * q.cm, "number_slots": 12 * q.count}
+        self.assertEqual(
+            units.to_api_data("stator", values), _baseline_data("stator", values)
+        )
+
+    def test_job_to_api_si(self):
+        machine = tinarm.Machine(
+            {"stator_bore": 8.20 * q.cm},
+            {"number_poles": 10 * q.count},
+            {"fill_factor": 42 * q.percent},
+        )
+        job = tinarm.Job(machine, {"simulated_speed": 2060 * q.rpm}, {}, title="test")
+        data = {(d["section"], d["name"]): d["value"] for d in job.to_api(si=True)["data"]}
+
+        self.assertAlmostEqual(data["stator", "stator_bore"]["magnitude"][0], 0.082)
+        self.assertEqual(data["rotor", "number_poles"]["magnitude"], [10])
+        self.assertEqual(data["winding", "fill_factor"]["units"], [])
+        self.assertAlmostEqual(
+            data["operating_point", "simulated_speed"]["magnitude"][0],
+            2060 * 2 * np.pi / 60,
+        )
+
+    def test_m1_job_to_api_unchanged(self):
+        machine = _load_module(os.path.join(M1, "machine.py"))
+        operating_point = _load_module(
+            os.path.join(M1, "Nominal_24Nm_2060rpm", "operating_point.py")
+        ).operating_point
+        mq = machine.q
+        simulation = {
+            "samples_per_electrical_period": 180 * mq.count / mq.turn,
+            "timestep_intervals": 180 * mq.count,
+            "active_length": 65 * mq.mm * 0.97,
+        }
+        job = tinarm.Job(
+            tinarm.Machine(
+                machine.stator_parameters,
+                machine.rotor_parameters,
+                machine.winding_parameters,
+            ),
+            operating_point,
+            simulation,
+            title="M1",
+        )
+
+        expected = (
+            _baseline_data("operating_point", operating_point)
+            + _baseline_data("simulation", simulation)
+            + _baseline_data("stator", machine.stator_parameters)
+            + _baseline_data("rotor", machine.rotor_parameters)
+            + _baseline_data("winding", machine.winding_parameters)
+        )
+        self.assertEqual(job.to_api()["data"], expected)
+
+
+if __name__ == "__main__":
+    if is_running_under_teamcity():
+        runner = TeamcityTestRunner()
+    else:
+        runner = unittest.TextTestRunner()
+    unittest.main(testRunner=runner)
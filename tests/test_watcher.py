@@ -0,0 +1,117 @@
+import asyncio
+import mock
+import os
+import sys
+import unittest
+from teamcity import is_running_under_teamcity
+from teamcity.unittestpy import TeamcityTestRunner
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import tinarm
+from tinarm.api import JOB_STATUS
+
+
+class JobWatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.statuses = {"1": JOB_STATUS["Solving"], "2": JOB_STATUS["QueuedForSolving"]}
+        self.api = mock.Mock()
+        self.api.get_job.side_effect = lambda job_id, revalidate=False: {
+            "status": self.statuses[job_id]
+        }
+        self.watcher = tinarm.JobWatcher(self.api, max_workers=2)
+        self.addCleanup(self.watcher.close)
+
+    def test_poll_decodes_status(self):
+        self.watcher.watch(["1", "2"])
+        self.assertEqual(self.watcher.poll(), 2)
+        self.assertEqual(self.watcher.status("1"), "Solving")
+        self.assertEqual(self.watcher.status("2"), "QueuedForSolving")
+
+    def test_poll_revalidates(self):
+        self.watcher.watch(["1"])
+        self.watcher.poll()
+        self.api.get_job.assert_called_once_with("1", revalidate=True)
+
+    def test_only_due_jobs_polled(self):
+        self.watcher.watch(["1", "2"])
+        self.watcher.poll()
+        self.assertEqual(self.watcher.poll(), 0)
+        self.assertEqual(self.api.get_job.call_count, 2)
+
+    def test_interval_by_status(self):
+        self.watcher = tinarm.JobWatcher(
+            self.api, intervals={"Solving": 0, "QueuedForSolving": 60}
+        )
+        self.addCleanup(self.watcher.close)
+        self.watcher.watch(["1", "2"])
+        self.watcher.poll()
+        self.watcher.poll()
+        self.assertEqual(
+            sorted(c.args[0] for c in self.api.get_job.call_args_list), ["1", "1", "2"]
+        )
+
+    def test_callbacks_and_futures(self):
+        changes = []
+        self.watcher.on_change(lambda *change: changes.append(change))
+        futures = self.watcher.watch(["1"])
+
+        self.watcher.poll()
+        self.watcher.update("1", JOB_STATUS["Complete"])
+
+        self.assertEqual(
+            changes, [("1", None, "Solving"), ("1", "Solving", "Complete")]
+        )
+        self.assertEqual(futures["1"].result(timeout=0), "Complete")
+        self.assertTrue(self.watcher.done())
+        self.assertEqual(self.watcher.poll(), 0)
+
+    def test_poll_failure(self):
+        self.api.get_job.side_effect = Exception("503")
+        self.watcher.watch(["1"])
+        self.watcher.poll()
+        self.assertIsNone(self.watcher.status("1"))
+
+    def test_async_iterator(self):
+        self.watcher.watch(["1", "2"])
+
+        async def collect():
+            changes = []
+            async for change in self.watcher.changes():
+                changes.append(change)
+            return changes
+
+        async def run():
+            task = asyncio.create_task(collect())
+            await asyncio.sleep(0)
+            self.watcher.update("1", "Complete")
+            self.watcher.update("2", "Quarantined")
+            return await asyncio.wait_for(task, 1)
+
+        changes = asyncio.run(run())
+        self.assertEqual(changes, [("1", None, "Complete"), ("2", None, "Quarantined")])
+
+    def test_subscribe(self):
+        channel = mock.Mock()
+        self.watcher.watch(["1"])
+        self.watcher.subscribe(channel, "job.status.#")
+        channel.queue_bind.assert_called_once_with(
+            exchange="amq.topic", queue=mock.ANY, routing_key="job.status.#"
+        )
+
+        on_message = channel.basic_consume.call_args.kwargs["on_message_callback"]
+        on_message(channel, None, None, b'{"id": "1", "status": 70}')
+        on_message(channel, None, None, b"not json")
+        self.assertEqual(self.watcher.status("1"), "Complete")
+
+    def test_subscribe_catch_all_rejected(self):
+        with self.assertRaises(ValueError):
+            self.watcher.subscribe(mock.Mock(), "#")
+
+
+if __name__ == "__main__":
+    if is_running_under_teamcity():
+        runner = TeamcityTestRunner()
+    else:
+        runner = unittest.TextTestRunner()
+    unittest.main(testRunner=runner)
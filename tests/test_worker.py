@@ -0,0 +1,488 @@
+import gzip
+import json
+import mock
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import unittest
+from teamcity import is_running_under_teamcity
+from teamcity.unittestpy import TeamcityTestRunner
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from tinarm import worker
+
+JOB_ID = "4568"
+
+
+class MessageCompressionTestCase(unittest.TestCase):
+    def test_small_body_not_compressed(self):
+        body = json.dumps({"id": JOB_ID})
+        encoded, content_encoding = worker._encode_body(body)
+        self.assertIsNone(content_encoding)
+        self.assertEqual(encoded, body.encode())
+
+    def test_large_body_roundtrip(self):
+        body = json.dumps({"id": JOB_ID, "data": [0.0] * 100000}).encode()
+        encoded, content_encoding = worker._encode_body(body)
+        self.assertEqual(content_encoding, "gzip")
+        self.assertLess(len(encoded), len(body))
+        self.assertEqual(worker._decode_body(encoded, content_encoding), body)
+
+    @unittest.skipIf(worker.zstandard is None, "zstandard is not installed")
+    def test_zstd_roundtrip(self):
+        body = json.dumps({"id": JOB_ID, "data": [0.0] * 100000}).encode()
+        encoded, content_encoding = worker._encode_body(body, content_encoding="zstd")
+        self.assertEqual(content_encoding, "zstd")
+        self.assertEqual(worker._decode_body(encoded, content_encoding), body)
+
+    def test_published_encoding(self):
+        ch = mock.Mock()
+        body = json.dumps({"id": JOB_ID, "data": [0.0] * 100000})
+        worker._rabbitmq_queue_message(ch, "exchange", "solve", body)
+        properties = ch.basic_publish.call_args.kwargs["properties"]
+        self.assertEqual(properties.content_encoding, "gzip")
+
+    def test_published_uncompressed(self):
+        ch = mock.Mock()
+        body = json.dumps({"id": JOB_ID, "data": [0.0] * 100000})
+        worker._rabbitmq_queue_message(ch, "exchange", "solve", body, None)
+        self.assertEqual(ch.basic_publish.call_args.kwargs["body"], body.encode())
+        properties = ch.basic_publish.call_args.kwargs["properties"]
+        self.assertIsNone(properties.content_encoding)
+
+    def test_decode_plain_body(self):
+        body = json.dumps({"id": JOB_ID}).encode()
+        self.assertEqual(worker._decode_body(body, None), body)
+
+    def test_decode_gzip_body(self):
+        body = json.dumps({"id": JOB_ID}).encode()
+        self.assertEqual(worker._decode_body(gzip.compress(body), "gzip"), body)
+
+    def test_decode_unknown_encoding(self):
+        with self.assertRaises(ValueError):
+            worker._decode_body(b"{}", "br")
+
+
+def _make_worker(projects_path, **attributes):
+    """A StandardWorker that is not connected to a broker"""
+    w = worker.StandardWorker.__new__(worker.StandardWorker)
+    w._node_id = "testnode"
+    w._worker_name = "testworker"
+    w._projects_path = projects_path
+    w._send_log_as_artifact = False
+    w._send_telemetry = False
+    w._profile_jobs = False
+    w.payloads = worker.PayloadStore(projects_path)
+    w.api_throttle = worker.Throttle()
+    w._compress_checkpoints = False
+    w._message_encoding = worker.RABBIT_DEFAULT_CONTENT_ENCODING
+    w._draining = threading.Event()
+    w._prefetch_controller = None
+    w.__dict__.update(attributes)
+    return w
+
+
+class ProfilingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.projects_path = tempfile.mkdtemp()
+        self.profile_filename = os.path.join(
+            self.projects_path, "jobs", JOB_ID, "testworker.prof"
+        )
+
+    def test_profiled_call(self):
+        filename = os.path.join(self.projects_path, "test.prof")
+        result = worker._profiled_call(lambda body: (None, body), b"{}", filename)
+        self.assertEqual(result, (None, b"{}"))
+        self.assertGreater(pstats.Stats(filename).total_calls, 0)
+
+    def test_concurrent_profile_skipped(self):
+        filename = os.path.join(self.projects_path, "test.prof")
+        with worker._profile_lock:
+            result = worker._profiled_call(lambda body: (None, body), b"{}", filename)
+        self.assertEqual(result, (None, b"{}"))
+        self.assertFalse(os.path.isfile(filename))
+
+        # The lock is released after a profiled call, even one that raises
+        with self.assertRaises(ZeroDivisionError):
+            worker._profiled_call(lambda body: 1 / 0, b"{}", filename)
+        self.assertFalse(worker._profile_lock.locked())
+
+    def test_profile_requested_in_body(self):
+        w = _make_worker(self.projects_path)
+        body = json.dumps({"id": JOB_ID, "profile": True}).encode()
+        w._do_threaded_callback(mock.Mock(), mock.Mock(), 1, lambda b: (None, None), body)
+        self.assertTrue(os.path.isfile(self.profile_filename))
+
+    def test_profile_requested_in_header(self):
+        w = _make_worker(self.projects_path)
+        body = json.dumps({"id": JOB_ID}).encode()
+        properties = mock.Mock(
+            content_encoding=None, headers={worker.PROFILE_HEADER: True}
+        )
+        w._do_threaded_callback(
+            mock.Mock(), mock.Mock(), 1, lambda b: (None, None), body, properties
+        )
+        self.assertTrue(os.path.isfile(self.profile_filename))
+
+    def test_profile_off_by_default(self):
+        w = _make_worker(self.projects_path)
+        body = json.dumps({"id": JOB_ID}).encode()
+        w._do_threaded_callback(mock.Mock(), mock.Mock(), 1, lambda b: (None, None), body)
+        self.assertFalse(os.path.isfile(self.profile_filename))
+
+
+class TelemetryTestCase(unittest.TestCase):
+    @mock.patch.dict(os.environ, {"API_ROOT_URL": "http://example.com"})
+    @mock.patch("tinarm.worker.Api")
+    def test_telemetry_posted_as_job_data(self, mock_api):
+        w = _make_worker(tempfile.mkdtemp(), _send_telemetry=True)
+        body = json.dumps({"id": JOB_ID, "apikey": "1234"}).encode()
+        w._do_threaded_callback(mock.Mock(), mock.Mock(), 1, lambda b: (None, None), body)
+
+        calls = mock_api.return_value.create_job_data.call_args_list
+        names = [c.args[1].name for c in calls]
+        self.assertIn("wall_time", names)
+        self.assertIn("cpu_time", names)
+        self.assertTrue(all(c.args[0] == JOB_ID for c in calls))
+        self.assertTrue(all(c.args[1].section == "telemetry_testworker" for c in calls))
+        self.assertIs(mock_api.call_args.kwargs["throttle"], w.api_throttle)
+
+    @mock.patch.dict(os.environ, {"API_ROOT_URL": "http://example.com"})
+    @mock.patch("tinarm.worker.Api")
+    @mock.patch("tinarm.worker.ResourceUsage", wraps=worker.ResourceUsage)
+    def test_telemetry_off(self, mock_usage, mock_api):
+        w = _make_worker(tempfile.mkdtemp())
+        body = json.dumps({"id": JOB_ID, "apikey": "1234"}).encode()
+        w._do_threaded_callback(mock.Mock(), mock.Mock(), 1, lambda b: (None, None), body)
+        mock_usage.assert_called_once_with(None)
+        mock_api.return_value.create_job_data.assert_not_called()
+
+    @mock.patch("tinarm.worker.Api")
+    def test_telemetry_needs_api(self, mock_api):
+        w = _make_worker(tempfile.mkdtemp(), _send_telemetry=True)
+        body = json.dumps({"id": JOB_ID}).encode()
+        w._do_threaded_callback(mock.Mock(), mock.Mock(), 1, lambda b: (None, None), body)
+        mock_api.assert_not_called()
+
+
+class AdaptivePrefetchTestCase(unittest.TestCase):
+    def _make_worker(self, cpu, memory):
+        channel = mock.Mock()
+        w = _make_worker(
+            tempfile.mkdtemp(),
+            _threads=[],
+            _channel=channel,
+            _connection=mock.Mock(),
+            _prefetch_count=2,
+            _prefetch_controller=worker.PrefetchController(minimum=1, maximum=4),
+            _cpu_monitor=mock.Mock(**{"utilisation.return_value": cpu}),
+        )
+        w._consumers = {
+            "solve": worker._Consumer(channel, "solve", None, {}, pausable=False),
+            "mesh": worker._Consumer(channel, "mesh", None, {}, pausable=True),
+        }
+        self.memory = mock.patch(
+            "tinarm.worker.available_memory_fraction", return_value=memory
+        )
+        self.memory.start()
+        self.addCleanup(self.memory.stop)
+        return w
+
+    def test_pressure_lowers_prefetch_and_pauses(self):
+        w = self._make_worker(cpu=0.95, memory=0.5)
+        w._adapt_prefetch()
+
+        w._channel.basic_qos.assert_called_with(prefetch_count=1, global_qos=True)
+        self.assertEqual(w._prefetch_count, 1)
+        self.assertTrue(w._consumers["mesh"].paused)
+        self.assertFalse(w._consumers["solve"].paused)
+        w._connection.call_later.assert_called_once()
+
+    def test_draining_does_not_resume(self):
+        w = self._make_worker(cpu=0.3, memory=0.5)
+        w._consumers["mesh"].paused = True
+        w.drain()
+        w._adapt_prefetch()
+
+        w._channel.basic_consume.assert_not_called()
+        w._channel.basic_qos.assert_not_called()
+        self.assertTrue(w._consumers["mesh"].paused)
+        w._connection.call_later.assert_not_called()
+
+    @mock.patch("tinarm.worker.RabbitMQHandler")
+    @mock.patch("tinarm.worker._rabbitmq_connect")
+    def test_prefetch_range(self, mock_connect, mock_handler):
+        w = worker.StandardWorker(
+            "testnode",
+            "testworker",
+            "localhost",
+            5672,
+            "user",
+            "password",
+            False,
+            "exchange",
+            queue_prefetch_count=4,
+            adaptive_prefetch=True,
+            max_prefetch_count=8,
+            projects_path=tempfile.mkdtemp(),
+        )
+        worker.logger.removeHandler(mock_handler.return_value)
+
+        # The configured prefetch is where the controller starts, not its floor
+        self.assertEqual(w._prefetch_count, 4)
+        self.assertEqual(w._prefetch_controller.minimum, 1)
+        self.assertEqual(w._prefetch_controller.maximum, 8)
+        mock_connect.return_value.channel.return_value.basic_qos.assert_called_with(
+            prefetch_count=4, global_qos=True
+        )
+
+    def test_relief_resumes(self):
+        w = self._make_worker(cpu=0.3, memory=0.5)
+        w._consumers["mesh"].paused = True
+        w._adapt_prefetch()
+
+        w._channel.basic_qos.assert_not_called()
+        self.assertFalse(w._consumers["mesh"].paused)
+
+
+class _FakeChannel:
+    """A channel delivering from an endless queue within RabbitMQ's per
+    consumer and channel wide prefetch limits, nothing is ever acked
+    """
+
+    def __init__(self):
+        self.consumer_limit = 0
+        self.channel_limit = 0
+        self.unacked = {}
+        self.consumers = []
+
+    def basic_qos(self, prefetch_count, global_qos):
+        if global_qos:
+            self.channel_limit = prefetch_count
+        else:
+            self.consumer_limit = prefetch_count
+
+    def basic_consume(self, queue, on_message_callback, arguments):
+        tag = f"ctag{len(self.unacked)}"
+        self.unacked[tag] = 0
+        self.consumers.append((tag, self.consumer_limit))
+        return tag
+
+    def basic_cancel(self, tag):
+        self.consumers = [c for c in self.consumers if c[0] != tag]
+
+    def deliver(self):
+        delivered = 0
+        for tag, limit in self.consumers:
+            while (limit == 0 or self.unacked[tag] < limit) and (
+                self.channel_limit == 0 or sum(self.unacked.values()) < self.channel_limit
+            ):
+                self.unacked[tag] += 1
+                delivered += 1
+        return delivered
+
+
+class AdaptivePrefetchDeliveryTestCase(unittest.TestCase):
+    def test_lower_prefetch_takes_no_new_messages(self):
+        channel = _FakeChannel()
+        channel.basic_qos(prefetch_count=4, global_qos=False)
+        channel.basic_qos(prefetch_count=4, global_qos=True)
+        w = _make_worker(
+            tempfile.mkdtemp(),
+            _threads=[mock.Mock(**{"is_alive.return_value": True})] * 4,
+            _channel=channel,
+            _connection=mock.Mock(),
+            _prefetch_count=4,
+            _prefetch_controller=worker.PrefetchController(minimum=1, maximum=4),
+            _cpu_monitor=mock.Mock(**{"utilisation.return_value": 0.95}),
+        )
+        w._consumers = {
+            "solve": worker._Consumer(channel, "solve", None, {}, pausable=False),
+        }
+        w._consumers["solve"].consume()
+        self.assertEqual(channel.deliver(), 4)
+
+        with mock.patch("tinarm.worker.available_memory_fraction", return_value=0.5):
+            w._adapt_prefetch()
+        self.assertEqual(w._prefetch_count, 3)
+        self.assertEqual(channel.deliver(), 0)
+
+
+class QueueLimitsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.connection = mock.Mock()
+        self.connection.channel.side_effect = lambda: mock.Mock()
+        self.worker = _make_worker(
+            tempfile.mkdtemp(),
+            _threads=[],
+            _consumers={},
+            _channel=mock.Mock(),
+            _connection=self.connection,
+            _exchange="exchange",
+            _x_priority=0,
+            _prefetch_count=4,
+        )
+
+    def _prefetch(self, queue):
+        consumer = self.worker._consumers[queue]
+        return consumer.channel.basic_qos.call_args.kwargs["prefetch_count"]
+
+    def test_unlimited_queue_uses_worker_channel(self):
+        self.worker.bind("post", "post", lambda b: (None, None))
+        self.assertIs(self.worker._consumers["post"].channel, self.worker._channel)
+        self.worker._channel.basic_qos.assert_not_called()
+
+    def test_max_concurrency(self):
+        self.worker.bind("solve", "solve", lambda b: (None, None), max_concurrency=2)
+        self.assertIsNot(self.worker._consumers["solve"].channel, self.worker._channel)
+        self.assertEqual(self._prefetch("solve"), 2)
+
+    def test_weights(self):
+        self.worker.bind("solve", "solve", lambda b: (None, None), weight=3)
+        self.assertEqual(self._prefetch("solve"), 4)
+
+        self.worker.bind("post", "post", lambda b: (None, None), weight=1)
+        self.assertEqual(self._prefetch("solve"), 3)
+        self.assertEqual(self._prefetch("post"), 1)
+
+        # The channel wide limit applies without consuming again
+        solve_channel = self.worker._consumers["solve"].channel
+        solve_channel.basic_qos.assert_called_with(prefetch_count=3, global_qos=True)
+        solve_channel.basic_consume.assert_called_once()
+        solve_channel.basic_cancel.assert_not_called()
+
+    def test_invalid_limits(self):
+        with self.assertRaises(ValueError):
+            self.worker.bind("solve", "solve", lambda b: (None, None), weight=0)
+        with self.assertRaises(ValueError):
+            self.worker.bind("solve", "solve", lambda b: (None, None), max_concurrency=0)
+        self.assertEqual(self.worker._consumers, {})
+
+    def test_duplicate_bind(self):
+        self.worker.bind("solve", "solve", lambda b: (None, None), max_concurrency=2)
+        with self.assertRaises(ValueError):
+            self.worker.bind("solve", "solve.other", lambda b: (None, None))
+
+        # Binding another routing key without a callback is still allowed
+        self.worker.bind("solve", "solve.other", None)
+        self.assertEqual(list(self.worker._consumers), ["solve"])
+
+    def test_weight_and_max_concurrency(self):
+        self.worker.bind("solve", "solve", lambda b: (None, None), weight=3, max_concurrency=2)
+        self.worker.bind("post", "post", lambda b: (None, None), weight=1)
+        self.assertEqual(self._prefetch("solve"), 2)
+        self.assertEqual(self._prefetch("post"), 1)
+
+
+class AdaptiveQueueLimitsTestCase(unittest.TestCase):
+    def test_pressure_lowers_max_concurrency(self):
+        connection = mock.Mock()
+        connection.channel.side_effect = lambda: mock.Mock()
+        w = _make_worker(
+            tempfile.mkdtemp(),
+            _threads=[],
+            _consumers={},
+            _channel=mock.Mock(),
+            _connection=connection,
+            _exchange="exchange",
+            _x_priority=0,
+            _prefetch_count=4,
+            _prefetch_controller=worker.PrefetchController(minimum=1, maximum=4),
+            _cpu_monitor=mock.Mock(**{"utilisation.return_value": 0.95}),
+        )
+        w.bind("solve", "solve", lambda b: (None, None), max_concurrency=4)
+        solve_channel = w._consumers["solve"].channel
+        solve_channel.basic_qos.assert_called_with(prefetch_count=4, global_qos=True)
+
+        with mock.patch("tinarm.worker.available_memory_fraction", return_value=0.5):
+            w._adapt_prefetch()
+        self.assertEqual(w._prefetch_count, 3)
+        solve_channel.basic_qos.assert_called_with(prefetch_count=3, global_qos=True)
+
+
+class CheckpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.worker = _make_worker(tempfile.mkdtemp())
+        self.conn = mock.Mock()
+        self.ch = mock.Mock()
+        self.body = json.dumps({"id": JOB_ID}).encode()
+
+    def _run(self, func):
+        self.worker._do_threaded_callback(self.conn, self.ch, 7, func, self.body)
+        for c in self.conn.add_callback_threadsafe.call_args_list:
+            c.args[0]()
+
+    def test_completed_stage_clears_checkpoint(self):
+        def func(body):
+            checkpoint = worker.current_checkpoint()
+            checkpoint.save({"step": 1})
+            self.filename = checkpoint.filename
+            return None, None
+
+        self._run(func)
+        self.assertFalse(os.path.exists(self.filename))
+        self.ch.basic_ack.assert_called_once_with(7)
+        self.assertIsNone(worker.current_checkpoint())
+
+    def test_resume_from_checkpoint(self):
+        steps = []
+
+        def func(body):
+            checkpoint = worker.current_checkpoint()
+            start = checkpoint.load({"step": 0})["step"]
+            for step in range(start, 5):
+                checkpoint.check({"step": step})
+                steps.append(step)
+                if step == 2 and not self.worker._draining.is_set():
+                    # SIGTERM arrives during the first attempt
+                    self.worker.drain()
+            return None, None
+
+        self._run(func)
+        self.assertEqual(steps, [0, 1, 2])
+        self.ch.basic_nack.assert_called_once_with(7, requeue=True)
+        self.ch.basic_ack.assert_not_called()
+
+        # The message is redelivered to a worker that is not draining
+        steps.clear()
+        self.worker._draining.clear()
+        self.conn.reset_mock()
+        self._run(func)
+        self.assertEqual(steps, [3, 4])
+        self.ch.basic_ack.assert_called_once_with(7)
+
+    def test_drain_stops_consuming_and_waits(self):
+        thread = mock.Mock(**{"is_alive.side_effect": [True, False]})
+        consumer = mock.Mock(paused=False)
+        self.worker.__dict__.update(
+            _threads=[thread],
+            _consumers={"solve": consumer},
+            _prefetch_controller=None,
+            _connection=mock.Mock(),
+        )
+        self.worker._connection.process_data_events.side_effect = (
+            lambda time_limit: self.worker.drain()
+        )
+
+        with mock.patch("tinarm.worker.signal.signal") as mock_signal:
+            self.worker.start()
+
+        mock_signal.assert_called_once_with(
+            worker.signal.SIGTERM, self.worker._on_sigterm
+        )
+        self.assertTrue(self.worker._draining.is_set())
+        consumer.pause.assert_called_once()
+        # Connection events are processed until the last thread finishes
+        self.assertEqual(self.worker._connection.process_data_events.call_count, 3)
+        self.worker._connection.close.assert_called_once()
+
+
+if __name__ == "__main__":
+    if is_running_under_teamcity():
+        runner = TeamcityTestRunner()
+    else:
+        runner = unittest.TextTestRunner()
+    unittest.main(testRunner=runner)
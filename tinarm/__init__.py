@@ -1,11 +1,51 @@
 # -*- coding: utf-8 -*-
 
-from tinarm.worker import StandardWorker, DefaultIdLogFilter, HostnameFilter
-from tinarm.api import Api, NameQuantityPair, Quantity, Unit
-from tinarm.helpers import Machine, Job
+import importlib
 
 __title__ = "TINARM - Node creation tool for TAE workers"
 __version__ = "0.1"
 __author__ = "Martin West, Chris Wallis"
 __license__ = "MIT License"
 __copyright__ = "Copyright 2023 Tin Arm Engineering Ltd."
+
+# Public names and the module that provides them. Modules are only imported
+# on first access so that clients which never start a worker do not pay for
+# pika, ssl or numpy.
+_LAZY_ATTRIBUTES = {
+    "StandardWorker": "tinarm.worker",
+    "DefaultIdLogFilter": "tinarm.log",
+    "HostnameFilter": "tinarm.log",
+    "configure_logging": "tinarm.log",
+    "current_checkpoint": "tinarm.worker",
+    "Api": "tinarm.api",
+    "NameQuantityPair": "tinarm.api",
+    "Quantity": "tinarm.api",
+    "Unit": "tinarm.api",
+    "Checkpoint": "tinarm.checkpoint",
+    "JobInterrupted": "tinarm.checkpoint",
+    "PayloadStore": "tinarm.payload",
+    "Throttle": "tinarm.throttle",
+    "JobWatcher": "tinarm.watcher",
+    "JobView": "tinarm.jobview",
+    "HarmonicSeries": "tinarm.emf",
+    "SweepAggregator": "tinarm.aggregate",
+    "SweepTable": "tinarm.aggregate",
+    "Machine": "tinarm.helpers",
+    "Job": "tinarm.helpers",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRIBUTES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from tinarm.api import STATUS_JOB
+from tinarm.jobview import JobView
+from tinarm.watcher import WATCHER_FINAL_STATUSES
+
+AGGREGATE_DEFAULT_MAX_WORKERS = 16
+AGGREGATE_KEY_SECTION = "operating_point"
+AGGREGATE_JOB_ID_COLUMN = "job_id"
+AGGREGATE_STATUS_COLUMN = "status"
+
+logger = logging.getLogger(__name__)
+
+
+class SweepTable:
+    """
+    A columnar table of sweep results stored in a directory, one .npy file
+    per column, so that columns can be memory mapped.
+
+    The job_id and status columns are always present, every other column
+    is float64 with NaN for missing values.
+
+    Args:
+        path: The directory holding the table
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _column_filename(self, name):
+        return os.path.join(self.path, f"{name}.npy")
+
+    def column_names(self):
+        """
+        The column names, in the order they were written
+        """
+        try:
+            with open(os.path.join(self.path, "columns.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def __len__(self):
+        if AGGREGATE_JOB_ID_COLUMN not in self.column_names():
+            return 0
+        return len(self[AGGREGATE_JOB_ID_COLUMN])
+
+    def __getitem__(self, name):
+        """
+        A column, memory mapped read only
+        """
+        return np.load(self._column_filename(name), mmap_mode="r")
+
+    def columns(self):
+        """
+        All columns as a dict of name to memory mapped array
+        """
+        return {name: self[name] for name in self.column_names()}
+
+    def rows(self):
+        """
+        The rows as a dict of job id to dict of column values, read into memory
+        """
+        columns = {name: np.asarray(values) for name, values in self.columns().items()}
+        job_ids = columns.pop(AGGREGATE_JOB_ID_COLUMN, [])
+        return {
+            str(job_id): {name: values[i].item() for name, values in columns.items()}
+            for i, job_id in enumerate(job_ids)
+        }
+
+    def write(self, rows, names):
+        """
+        Replace the table with rows, a dict of job id to dict of column values.
+        Each column is written to a temporary file and moved into place.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        job_ids = list(rows)
+        columns = {AGGREGATE_JOB_ID_COLUMN: np.array(job_ids, dtype=str)}
+        columns[AGGREGATE_STATUS_COLUMN] = np.array(
+            [rows[j].get(AGGREGATE_STATUS_COLUMN, -1) for j in job_ids], dtype=np.int64
+        )
+        for name in names:
+            columns[name] = np.array(
+                [rows[j].get(name, np.nan) for j in job_ids], dtype=np.float64
+            )
+
+        for name, values in columns.items():
+            temp_filename = f"{self._column_filename(name)}.tmp"
+            with open(temp_filename, "wb") as f:
+                np.save(f, values)
+            os.replace(temp_filename, self._column_filename(name))
+
+        temp_filename = os.path.join(self.path, "columns.json.tmp")
+        with open(temp_filename, "w") as f:
+            json.dump(list(columns), f)
+        os.replace(temp_filename, os.path.join(self.path, "columns.json"))
+
+
+def _scalar(view, section, name):
+    value = view.get(section, name)
+    if value is None:
+        return np.nan
+    if value.size != 1:
+        logger.warning(f"{section}.{name} of job {view.id} is not a scalar, skipping")
+        return np.nan
+    return float(value.flat[0])
+
+
+class SweepAggregator:
+    """
+    Collects the results of a sweep into a SweepTable.
+
+    Jobs are fetched concurrently with a bounded number of requests in flight.
+    Give the Api a pooled session (transfer.pooled_session) so connections are
+    reused. Each row is keyed by the job's operating point, every scalar in the
+    operating_point section becomes a column, alongside the requested result
+    columns.
+
+    Re-running update() only fetches jobs that are new, had not reached a
+    final status, or were written before a requested column was added to the
+    table. A job in a final status is not fetched again for a value that was
+    missing (NaN), such as a result the job did not produce or one that is
+    not a scalar. Only the fetching is incremental, every column file is
+    rewritten by an update that fetched anything.
+
+    A job that cannot be fetched is logged and skipped, keeping its previous
+    row if it had one, and is tried again by the next update().
+
+    Args:
+        api: The Api to fetch jobs with
+        path: The directory of the table
+        columns: dict of column name to (section, name) of the job data
+        max_workers: The most get_job requests in flight at once
+    """
+
+    def __init__(self, api, path, columns, max_workers=AGGREGATE_DEFAULT_MAX_WORKERS):
+        self._api = api
+        self._columns = dict(columns)
+        self._max_workers = max_workers
+        self.table = SweepTable(path)
+
+    def _row(self, job_id):
+        view = JobView(self._api.get_job(job_id))
+        row = {AGGREGATE_STATUS_COLUMN: view.job.get("status", -1)}
+        for name in view.names(AGGREGATE_KEY_SECTION):
+            row[name] = _scalar(view, AGGREGATE_KEY_SECTION, name)
+        for column, (section, name) in self._columns.items():
+            row[column] = _scalar(view, section, name)
+        return row
+
+    def _is_current(self, row):
+        # Rows read back have every column of the table, NaN where missing, so
+        # this only finds columns added since the table was written
+        status = row.get(AGGREGATE_STATUS_COLUMN)
+        return STATUS_JOB.get(status) in WATCHER_FINAL_STATUSES and all(
+            column in row for column in self._columns
+        )
+
+    def update(self, job_ids):
+        """
+        Fetch new or changed jobs and rewrite the table, returns the number fetched
+        """
+        rows = self.table.rows()
+        stale = [j for j in job_ids if j not in rows or not self._is_current(rows[j])]
+
+        fetched = 0
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            futures = {job_id: executor.submit(self._row, job_id) for job_id in stale}
+            for job_id, future in futures.items():
+                try:
+                    rows[job_id] = future.result()
+                    fetched += 1
+                except Exception as e:
+                    logger.error(f"Failed to fetch job {job_id}, skipping: {e}")
+
+        if fetched:
+            # Keep the existing column order, then any new columns
+            names = dict.fromkeys(self.table.column_names())
+            for row in rows.values():
+                names.update(dict.fromkeys(row))
+            names.pop(AGGREGATE_JOB_ID_COLUMN, None)
+            names.pop(AGGREGATE_STATUS_COLUMN, None)
+            self.table.write(rows, list(names))
+
+        logger.info(f"Fetched {fetched} of {len(job_ids)} jobs into {self.table.path}")
+        return fetched
@@ -1,9 +1,10 @@
 import logging
+import threading
 import time
 import requests
 from math import prod
 
-LOGGING_LEVEL = logging.INFO
+from tinarm import transfer
 
 JOB_STATUS = {
     "New": 0,
@@ -23,21 +24,61 @@ JOB_STATUS = {
 
 STATUS_JOB = {value:key for key,value in JOB_STATUS.items()}
 
-### Configure Logging
-logger = logging.getLogger()
-logger.setLevel(LOGGING_LEVEL)
+logger = logging.getLogger(__name__)
 
 
 class Unit:
-    def __init__(self, name: str, exponent: int):
-        self.name = name
-        self.exponent = exponent
+    """
+    A unit name and exponent. Units are immutable and interned, so equal
+    units are the same object.
+    """
+
+    __slots__ = ("name", "exponent", "_dict")
+    _interned = {}
+
+    def __new__(cls, name: str, exponent: int):
+        key = (name, exponent, type(exponent))
+        unit = cls._interned.get(key)
+        if unit is None:
+            unit = object.__new__(cls)
+            object.__setattr__(unit, "name", name)
+            object.__setattr__(unit, "exponent", exponent)
+            object.__setattr__(unit, "_dict", {"name": name, "exponent": exponent})
+            unit = cls._interned.setdefault(key, unit)
+        return unit
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Unit is immutable")
+
+    def __reduce__(self):
+        return Unit, (self.name, self.exponent)
+
+    def __repr__(self):
+        return f"Unit({self.name!r}, {self.exponent!r})"
 
     def to_dict(self):
-        return {
-            "name": self.name,
-            "exponent": self.exponent,
-        }
+        # A copy of the cached dict, callers may modify what they are given
+        return self._dict.copy()
+
+
+def _magnitude_and_shape(magnitude, shape=None):
+    """
+    The magnitude as a flat list, or list-like, and its shape for the API
+    """
+    if hasattr(magnitude, "shape"):
+        if shape is None:
+            return magnitude.flatten().tolist(), magnitude.shape
+        if prod(shape) == magnitude.size:
+            return magnitude.tolist(), shape
+        raise ValueError(f"Shape {shape} does not match magnitude size {magnitude.size}")
+
+    if not hasattr(magnitude, "__len__"):
+        return [magnitude], [1]
+    if shape is None:
+        return magnitude, [len(magnitude)]
+    if prod(shape) != len(magnitude):
+        raise ValueError(f"Shape {shape} does not match magnitude size {len(magnitude)}")
+    return magnitude, shape
 
 
 class Quantity:
@@ -55,33 +96,10 @@ class Quantity:
         units (list[Unit]): A list of Unit objects representing the units of the quantity.
     """
 
-    def __init__(self, magnitude, units=None, shape=None):
-        if hasattr(magnitude, "shape"):
-            if shape is None:
-                self.shape = magnitude.shape
-                self.magnitude = magnitude.flatten().tolist()
-            elif prod(shape) == magnitude.size:
-                self.magnitude = magnitude.tolist()
-                self.shape = shape
-            else:
-                raise ValueError(
-                    f"Shape {shape} does not match magnitude size {magnitude.size}"
-                )
-
-        elif not hasattr(magnitude, "__len__"):
-            self.magnitude = [magnitude]
-            self.shape = [1]
-        elif shape is None:
-            self.shape = [len(magnitude)]
-            self.magnitude = magnitude
-        elif prod(shape) != len(magnitude):
-            raise ValueError(
-                f"Shape {shape} does not match magnitude size {len(magnitude)}"
-            )
-        else:
-            self.magnitude = magnitude
-            self.shape = shape
+    __slots__ = ("magnitude", "shape", "units")
 
+    def __init__(self, magnitude, units=None, shape=None):
+        self.magnitude, self.shape = _magnitude_and_shape(magnitude, shape)
         self.units = [Unit(*u) if type(u) != Unit else u for u in units]
 
     def to_dict(self):
@@ -99,6 +117,8 @@ class Quantity:
 
 
 class NameQuantityPair:
+    __slots__ = ("section", "name", "value")
+
     def __init__(self, section, name, value: Quantity):
         self.section = section
         self.name = name
@@ -112,38 +132,181 @@ class NameQuantityPair:
         }
 
 
+class ResponseCache:
+    """
+    A local cache of API responses with a time to live, revalidated with
+    ETag / If-None-Match once expired.
+
+    Args:
+        ttl: Seconds a response is used without asking the server
+    """
+
+    def __init__(self, ttl):
+        self._ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+
+    def lookup(self, key, revalidate=False):
+        """
+        Returns (value, etag) of a cached response, value is None if it
+        must be checked with the server
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None
+            expires, etag, value = entry
+            if not revalidate and time.monotonic() < expires:
+                self.hits += 1
+                return value, etag
+            return None, etag
+
+    def store(self, key, etag, value):
+        """
+        Cache a response that had to be fetched in full
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self._ttl, etag, value)
+            self.misses += 1
+
+    def revalidated(self, key):
+        """
+        The server confirmed the cached response is current. Returns None if
+        the entry was invalidated meanwhile, so it must be fetched in full.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, etag, value = entry
+            self._entries[key] = (time.monotonic() + self._ttl, etag, value)
+            self.revalidations += 1
+            return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "revalidations": self.revalidations,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+
 class Api:
     """
     The TAE API
     """
 
-    def __init__(self, root_url, api_key, org_id=None, node_id=None):
+    def __init__(
+        self,
+        root_url,
+        api_key,
+        org_id=None,
+        node_id=None,
+        cache_ttl=None,
+        session=None,
+        throttle=None,
+    ):
         """
         Initialize the API
+
+        If cache_ttl is given, get_job responses are cached for that many seconds,
+        then revalidated with the server using their ETag. Jobs changed through
+        this Api are removed from the cache.
+
+        A requests.Session, such as transfer.pooled_session(), can be given to
+        reuse connections across calls, and across threads sharing this Api.
+
+        A throttle.Throttle rate limits requests by endpoint class (jobs, status,
+        data and artifacts), retries overloaded requests honouring Retry-After and
+        stops sending while an endpoint keeps failing. Pass the same Throttle to
+        every Api in a process so they back off together.
         """
 
         self._root_url = root_url
         self._api_key = api_key
         self._org_id = org_id
         self._node_id = node_id
+        self._cache = None if cache_ttl is None else ResponseCache(cache_ttl)
+        self._session = session
+        self._throttle = throttle
 
         logger.info(f"root_url: {self._root_url}")
 
-    def get_job(self, job_id):
+    @property
+    def _http(self):
+        return requests if self._session is None else self._session
+
+    def cache_stats(self):
         """
-        Get a job from the TAE API
+        Hit, revalidation and miss counts of the response cache, None if it is disabled
         """
-        response = requests.get(
-            url=f"{self._root_url}/jobs/{job_id}?apikey={self._api_key}",
+        return None if self._cache is None else self._cache.stats()
+
+    def throttle_stats(self):
+        """
+        Request, retry and failure counts by endpoint class, None if there is no throttle
+        """
+        return None if self._throttle is None else self._throttle.stats()
+
+    def _request(self, endpoint, method, **kwargs):
+        send = getattr(self._http, method)
+        if self._throttle is None:
+            return send(**kwargs)
+        return self._throttle.request(
+            endpoint, lambda: send(**kwargs), idempotent=method != "post"
         )
+
+    def _invalidate_job(self, job_id):
+        if self._cache is not None:
+            self._cache.invalidate(job_id)
+
+    def get_job(self, job_id, revalidate=False):
+        """
+        Get a job from the TAE API
+
+        With the cache enabled the returned job may be shared, so must not be modified.
+        If revalidate is True a cached job is always checked with the server.
+        """
+        url = f"{self._root_url}/jobs/{job_id}?apikey={self._api_key}"
+        if self._cache is None:
+            response = self._request("jobs", "get", url=url)
+            response.raise_for_status()
+            return response.json()
+
+        job, etag = self._cache.lookup(job_id, revalidate)
+        if job is not None:
+            return job
+
+        headers = {} if etag is None else {"If-None-Match": etag}
+        response = self._request("jobs", "get", url=url, headers=headers)
+        if response.status_code == 304:
+            job = self._cache.revalidated(job_id)
+            if job is not None:
+                return job
+            # Invalidated by another thread since the lookup, fetch it in full
+            response = self._request("jobs", "get", url=url)
+
         response.raise_for_status()
-        return response.json()
+        job = response.json()
+        self._cache.store(job_id, response.headers.get("ETag"), job)
+        return job
 
     def create_job(self, job):
         """
         Create a job for the TAE API
         """
-        response = requests.post(
+        response = self._request(
+            "jobs",
+            "post",
             url=f"{self._root_url}/jobs/?apikey={self._api_key}&org_id={self._org_id}",
             json=job.to_api(),
         )
@@ -159,15 +322,16 @@ class Api:
         url = f"{self._root_url}/jobs/{job_id}/status/{status}?node_id={self._node_id}&apikey={self._api_key}&percentage_complete={percentage_complete}"
         logger.info(f"Updating job status: {url}")
 
-        response = requests.put(url=url)
+        response = self._request("status", "put", url=url)
+        self._invalidate_job(job_id)
         response.raise_for_status()
         return response.json()
 
-    def get_job_artifact(self, job_id, artifact_id):
+    def get_job_artifact(self, job_id, artifact_id, revalidate=False):
         """
         Get job artifact
         """
-        job = self.get_job(job_id)
+        job = self.get_job(job_id, revalidate)
         for artifact in job["artifacts"]:
             if artifact["id"] == artifact_id:
                 return artifact
@@ -184,7 +348,7 @@ class Api:
 
         for i in range(0, 10):
             time.sleep(5)
-            artifact = self.get_job_artifact(job_id, artifact_id)
+            artifact = self.get_job_artifact(job_id, artifact_id, revalidate=True)
             if artifact["url"].startswith("https"):
                 return artifact
 
@@ -196,7 +360,9 @@ class Api:
         """
         Post an artifact to a job
         """
-        response = requests.post(
+        response = self._request(
+            "artifacts",
+            "post",
             url=f"{self._root_url}/jobs/{job_id}/artifacts?promote={promote}&apikey={self._api_key}",
             json={
                 "created_on_node": self._node_id,
@@ -204,6 +370,7 @@ class Api:
                 "url": url,
             },
         )
+        self._invalidate_job(job_id)
         response.raise_for_status()
         return response.json()
 
@@ -215,14 +382,57 @@ class Api:
             job_id, type, f"file://{self._node_id}{filename}", promote
         )
 
+    def upload_job_artifact(
+        self, job_id, type, filename, chunk_size=transfer.TRANSFER_DEFAULT_CHUNK_SIZE
+    ):
+        """
+        Post an artifact to a job and upload the file content, streamed in
+        resumable chunks
+        """
+        artifact = self.create_job_artifact_from_file(job_id, type, filename)
+        response = transfer.upload_file(
+            url=f"{self._root_url}/jobs/{job_id}/artifacts/{artifact['id']}/content?apikey={self._api_key}",
+            filename=filename,
+            chunk_size=chunk_size,
+            session=self._session,
+            throttle=self._throttle,
+        )
+        self._invalidate_job(job_id)
+        return response.json()
+
+    def download_job_artifact(
+        self,
+        job_id,
+        artifact_id,
+        filename,
+        checksum=None,
+        workers=transfer.TRANSFER_DEFAULT_WORKERS,
+    ):
+        """
+        Download a promoted artifact to filename with parallel range requests,
+        verifying the sha256 checksum if given or recorded on the artifact
+        """
+        artifact = self.get_promoted_job_artifact(job_id, artifact_id)
+        return transfer.download_file(
+            artifact["url"],
+            filename,
+            checksum=checksum or artifact.get("checksum"),
+            workers=workers,
+            session=self._session,
+            throttle=self._throttle,
+        )
+
     def update_job_artifact(self, job_id, artifact_id, artifact):
         """
         Update an artifact
         """
-        response = requests.put(
+        response = self._request(
+            "artifacts",
+            "put",
             url=f"{self._root_url}/jobs/{job_id}/artifacts/{artifact_id}?apikey={self._api_key}",
             json=artifact,
         )
+        self._invalidate_job(job_id)
         response.raise_for_status()
         return response.json()
 
@@ -230,9 +440,12 @@ class Api:
         """
         Promote an artifact to a job
         """
-        response = requests.put(
+        response = self._request(
+            "artifacts",
+            "put",
             url=f"{self._root_url}/jobs/{job_id}/artifacts/{artifact_id}/promote?apikey={self._api_key}",
         )
+        self._invalidate_job(job_id)
         response.raise_for_status()
         return response.json()
 
@@ -240,9 +453,12 @@ class Api:
         """
         Delete a job
         """
-        response = requests.delete(
+        response = self._request(
+            "jobs",
+            "delete",
             url=f"{self._root_url}/jobs/{job_id}?apikey={self._api_key}",
         )
+        self._invalidate_job(job_id)
         response.raise_for_status()
         return
 
@@ -250,10 +466,13 @@ class Api:
         """
         Create job data
         """
-        response = requests.post(
+        response = self._request(
+            "data",
+            "post",
             url=f"{self._root_url}/jobs/{job_id}/data?apikey={self._api_key}",
             json=data.to_dict(),
         )
+        self._invalidate_job(job_id)
         response.raise_for_status()
         return response.json()
 
@@ -261,10 +480,13 @@ class Api:
         """
         Update job data
         """
-        response = requests.put(
+        response = self._request(
+            "data",
+            "put",
             url=f"{self._root_url}/jobs/{job_id}/data/{data_name}?apikey={self._api_key}",
             json=data.to_dict(),
         )
+        self._invalidate_job(job_id)
         response.raise_for_status()
         return response.json()
 
@@ -272,16 +494,21 @@ class Api:
         """
         Delete job data
         """
-        response = requests.delete(
+        response = self._request(
+            "data",
+            "delete",
             url=f"{self._root_url}/jobs/{job_id}/data/{data_name}?apikey={self._api_key}",
         )
+        self._invalidate_job(job_id)
         response.raise_for_status()
 
     def get_reusable_artifact(self, hash):
         """
         Get a reusable artifact from the TAE API
         """
-        response = requests.get(
+        response = self._request(
+            "artifacts",
+            "get",
             url=f"{self._root_url}/reusable_artifacts/{hash}?apikey={self._api_key}",
         )
         response.raise_for_status()
@@ -291,7 +518,9 @@ class Api:
         """
         Update a reusable_artifact
         """
-        response = requests.put(
+        response = self._request(
+            "artifacts",
+            "put",
             url=f"{self._root_url}/reusable_artifacts/{hash}?apikey={self._api_key}",
             json=reusable_artifact,
         )
@@ -302,7 +531,9 @@ class Api:
         """
         Update an reusable_artifact's URL
         """
-        response = requests.patch(
+        response = self._request(
+            "artifacts",
+            "patch",
             url=f"{self._root_url}/reusable_artifacts/{hash}/url?apikey={self._api_key}",
             json={"url": url, "mimetype": mimetype},
         )
@@ -313,7 +544,9 @@ class Api:
         """
         Create reusable_artifact data
         """
-        response = requests.post(
+        response = self._request(
+            "data",
+            "post",
             url=f"{self._root_url}/reusable_artifacts/{hash}/data?apikey={self._api_key}",
             json=data.to_dict(),
         )
@@ -324,7 +557,9 @@ class Api:
         """
         Promote reusable artifact
         """
-        response = requests.put(
+        response = self._request(
+            "artifacts",
+            "put",
             url=f"{self._root_url}/reusable_artifacts/{hash}/promote?apikey={self._api_key}",
         )
         response.raise_for_status()
@@ -0,0 +1,103 @@
+import gzip
+import logging
+import os
+import pickle
+import threading
+import uuid
+
+CHECKPOINT_DIRECTORY = "checkpoints"
+CHECKPOINT_SUFFIX = ".ckpt"
+CHECKPOINT_GZIP_MAGIC = b"\x1f\x8b"
+CHECKPOINT_GZIP_LEVEL = 1
+
+logger = logging.getLogger(__name__)
+
+
+class JobInterrupted(Exception):
+    """
+    Raised by a callback to stop a job that the worker should requeue,
+    normally from Checkpoint.check() while the worker is draining
+    """
+
+
+class Checkpoint:
+    """
+    The saved progress of one stage of a job, so that a redelivered
+    message can resume where the previous attempt stopped.
+
+    State is pickled to {directory}/checkpoints/{name}.ckpt with a write
+    to a temporary file that is then moved into place, so a checkpoint is
+    never seen half written. Compressed checkpoints are gzipped.
+
+    Args:
+        directory: The job directory, {projects_path}/jobs/{job_id}
+        name: The stage name, usually the worker name
+        compress: Gzip checkpoints when saving
+        draining: A threading.Event set when the worker is shutting down
+    """
+
+    def __init__(self, directory, name, compress=False, draining=None):
+        self.filename = os.path.join(
+            directory, CHECKPOINT_DIRECTORY, f"{name}{CHECKPOINT_SUFFIX}"
+        )
+        self._compress = compress
+        self._draining = draining if draining is not None else threading.Event()
+
+    @property
+    def draining(self):
+        """True once the worker has been asked to stop"""
+        return self._draining.is_set()
+
+    def exists(self):
+        return os.path.isfile(self.filename)
+
+    def save(self, state):
+        """
+        Replace the checkpoint with state, which must be picklable
+        """
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        if self._compress:
+            data = gzip.compress(data, compresslevel=CHECKPOINT_GZIP_LEVEL)
+
+        temp_filename = f"{self.filename}.{uuid.uuid4().hex}.tmp"
+        with open(temp_filename, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filename, self.filename)
+        logger.debug(f"Saved {len(data)} byte checkpoint {self.filename}")
+
+    def load(self, default=None):
+        """
+        The saved state, or default if there is no checkpoint
+        """
+        try:
+            with open(self.filename, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return default
+
+        if data[:2] == CHECKPOINT_GZIP_MAGIC:
+            data = gzip.decompress(data)
+        logger.info(f"Resuming from checkpoint {self.filename}")
+        return pickle.loads(data)
+
+    def clear(self):
+        """
+        Remove the checkpoint once the stage has completed
+        """
+        try:
+            os.remove(self.filename)
+        except FileNotFoundError:
+            pass
+
+    def check(self, state=None):
+        """
+        Call between units of work. If the worker is draining, save state
+        (unless it is None) and raise JobInterrupted so the message is requeued.
+        """
+        if self.draining:
+            if state is not None:
+                self.save(state)
+            raise JobInterrupted(f"Worker is shutting down, checkpoint {self.filename}")
@@ -0,0 +1,128 @@
+import numpy as np
+
+EMF_DEFAULT_CHUNK_SIZE = 65536
+
+
+class HarmonicSeries:
+    """
+    A fitted Fourier cosine series, such as a back EMF waveform,
+
+        f(theta_m) = sum_k a_k cos(n_k (phase + pole_pairs * theta_m - 2 pi j / phases))
+
+    with harmonic orders n_k = 1, 1 + step, 1 + 2 step, ... evaluated for
+    every phase j and for a batch of coefficient sets, one per operating point.
+
+    Args:
+        coefficients: Harmonic amplitudes, shape (H,) or (..., H) for a batch
+        phase: Electrical phase offset in radians, a float or broadcastable to the batch shape
+        pole_pairs: The number of pole pairs, mechanical angles are multiplied by it
+        step: The step between harmonic orders, 2 for odd harmonics only
+        phases: The number of machine phases, phase j is delayed by 2 pi j / phases
+            electrical radians. None evaluates a single phase.
+
+    Example, equivalent to examples/phase_a_emf.py:
+
+        emf = HarmonicSeries(coefs, phase=phase_emf_a, pole_pairs=5)
+        emf_a = emf(theta_m)
+    """
+
+    def __init__(self, coefficients, phase=0.0, pole_pairs=1, step=2, phases=None):
+        coefficients = np.asarray(coefficients, dtype=float)
+        if coefficients.ndim == 0 or coefficients.shape[-1] == 0:
+            raise ValueError("At least one harmonic coefficient is required")
+
+        self.pole_pairs = pole_pairs
+        self.step = step
+        self.phases = phases
+        self.orders = 1 + step * np.arange(coefficients.shape[-1])
+        self.coefficients = coefficients
+
+        # Angles are evaluated with shape (..., phases, N), so the phase is
+        # kept with those two trailing axes and the coefficients with the
+        # harmonic axis first, so each one broadcasts against the angles
+        offsets = np.zeros(1) if phases is None else 2 * np.pi * np.arange(phases) / phases
+        self._phase = (np.asarray(phase, dtype=float)[..., None] - offsets)[..., None]
+        self._harmonics = np.moveaxis(coefficients, -1, 0)[..., None, None]
+        self._spectra = {}
+
+    def _batch_shape(self):
+        """The batch shape followed by the phase axis"""
+        return np.broadcast_shapes(
+            self.coefficients.shape[:-1] + (1,), self._phase.shape[:-1]
+        )
+
+    @property
+    def shape(self):
+        """The shape of the result excluding the angle axis"""
+        shape = self._batch_shape()
+        return shape if self.phases is not None else shape[:-1]
+
+    def __call__(self, theta_m, chunk_size=EMF_DEFAULT_CHUNK_SIZE):
+        return self.evaluate(theta_m, chunk_size)
+
+    def evaluate(self, theta_m, chunk_size=EMF_DEFAULT_CHUNK_SIZE):
+        """
+        Evaluate at mechanical angles theta_m (radians, 1D).
+
+        Uses Clenshaw summation of the cosine recurrence
+        cos((n + step) x) = 2 cos(step x) cos(n x) - cos((n - step) x),
+        so only two or three cosines are computed per angle and no
+        harmonics x angles temporary is allocated. Angles are processed
+        in chunks to bound memory.
+
+        Returns an array of shape self.shape + (len(theta_m),)
+        """
+        theta_m = np.asarray(theta_m, dtype=float)
+        if theta_m.ndim != 1:
+            raise ValueError("theta_m must be one dimensional")
+
+        result = np.empty(self._batch_shape() + theta_m.shape)
+        for start in range(0, theta_m.size, chunk_size):
+            chunk = slice(start, start + chunk_size)
+            result[..., chunk] = self._clenshaw(theta_m[chunk])
+
+        return result if self.phases is not None else result[..., 0, :]
+
+    def _clenshaw(self, theta_m):
+        x = self._phase + self.pole_pairs * theta_m
+        alpha = 2 * np.cos(self.step * x)
+
+        # b_k = a_k + alpha b_(k+1) - b_(k+2), rotating three buffers
+        shape = np.broadcast_shapes(self._harmonics.shape[1:], x.shape)
+        b0, b1, b2 = np.empty(shape), np.zeros(shape), np.zeros(shape)
+        for a in self._harmonics[::-1]:
+            np.multiply(alpha, b1, out=b0)
+            b0 -= b2
+            b0 += a
+            b0, b1, b2 = b2, b0, b1
+
+        # b1 and b2 now hold b_0 and b_1, the sum is b_0 cos(x) - b_1 cos((1 - step) x)
+        cos_x = np.cos(x)
+        previous = cos_x if self.step == 2 else np.cos((1 - self.step) * x)
+        return b1 * cos_x - b2 * previous
+
+    def evaluate_uniform(self, samples):
+        """
+        Evaluate at samples equally spaced mechanical angles over one
+        revolution, 2 pi i / samples, with an inverse real FFT. The spectrum
+        for each number of samples is cached.
+
+        Returns an array of shape self.shape + (samples,)
+        """
+        spectrum = self._spectra.get(samples)
+        if spectrum is None:
+            bins = self.orders * self.pole_pairs
+            if bins[-1] >= samples // 2:
+                raise ValueError(
+                    f"{samples} samples cannot resolve harmonic order {self.orders[-1]} with {self.pole_pairs} pole pairs"
+                )
+            # a_k cos(m_k theta + phi_k) is bin m_k with amplitude samples / 2 a_k exp(i phi_k)
+            terms = (samples / 2) * self.coefficients[..., None, :] * np.exp(
+                1j * self.orders * self._phase
+            )
+            spectrum = np.zeros(terms.shape[:-1] + (samples // 2 + 1,), complex)
+            spectrum[..., bins] = terms
+            self._spectra[samples] = spectrum
+
+        result = np.fft.irfft(spectrum, n=samples)
+        return result if self.phases is not None else result[..., 0, :]
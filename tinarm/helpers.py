@@ -1,4 +1,4 @@
-from . import Quantity, NameQuantityPair
+from tinarm.units import to_api_data
 import random
 import requests
 
@@ -13,24 +13,16 @@ class Machine(object):
     def __repr__(self) -> str:
         return f"Machine({self.stator}, {self.rotor}, {self.winding})"
 
-    def to_api(self):
-        stator_api = [
-            NameQuantityPair("stator", k, Quantity(*self.stator[k].to_tuple()))
-            for k in self.stator
-        ]
-        rotor_api = [
-            NameQuantityPair("rotor", k, Quantity(*self.rotor[k].to_tuple()))
-            for k in self.rotor
-        ]
-        winding_api = [
-            NameQuantityPair("winding", k, Quantity(*self.winding[k].to_tuple()))
-            for k in self.winding
-        ]
-        data = []
-        data.extend(list(x.to_dict() for x in stator_api))
-        data.extend(list(x.to_dict() for x in rotor_api))
-        data.extend(list(x.to_dict() for x in winding_api))
-        return data
+    def to_api(self, si=False):
+        """
+        The machine parameters as API job data, in their own units or in SI
+        base units if si is True
+        """
+        return (
+            to_api_data("stator", self.stator, si)
+            + to_api_data("rotor", self.rotor, si)
+            + to_api_data("winding", self.winding, si)
+        )
 
 
 class Job(object):
@@ -71,7 +63,11 @@ class Job(object):
         title = f"{adjective}-{noun}"
         return title
 
-    def to_api(self):
+    def to_api(self, si=False):
+        """
+        The job for the API, with its quantities in their own units or in SI
+        base units if si is True
+        """
         job = {
             "status": 0,
             "title": self.title,
@@ -80,20 +76,9 @@ class Job(object):
             "data": [],
         }
 
-        operating_point_api = [
-            NameQuantityPair(
-                "operating_point", k, Quantity(*self.operating_point[k].to_tuple())
-            )
-            for k in self.operating_point
-        ]
-
-        simulation_api = [
-            NameQuantityPair("simulation", k, Quantity(*self.simulation[k].to_tuple()))
-            for k in self.simulation
-        ]
-        job["data"].extend(list(x.to_dict() for x in operating_point_api))
-        job["data"].extend(list(x.to_dict() for x in simulation_api))
-        job["data"].extend(self.machine.to_api())
+        job["data"].extend(to_api_data("operating_point", self.operating_point, si))
+        job["data"].extend(to_api_data("simulation", self.simulation, si))
+        job["data"].extend(self.machine.to_api(si))
         return job
 
     def run(self):
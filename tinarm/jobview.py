@@ -0,0 +1,91 @@
+import numpy as np
+
+from tinarm.api import STATUS_JOB, Unit
+
+
+class JobView:
+    """
+    An indexed view of a job as returned by Api.get_job.
+
+    Job data is indexed by (section, name) and artifacts by id and type.
+    Each data value is only decoded into a numpy array, with its original
+    shape, the first time it is accessed.
+
+    Args:
+        job: The job dict from Api.get_job
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self._values = {
+            (d["section"], d["name"]): d["value"] for d in job.get("data", [])
+        }
+        self._arrays = {}
+
+        self._artifacts = {}
+        self._artifacts_by_type = {}
+        for artifact in job.get("artifacts", []):
+            self._artifacts[artifact["id"]] = artifact
+            self._artifacts_by_type.setdefault(artifact["type"], []).append(artifact)
+
+    @classmethod
+    def from_api(cls, api, job_id):
+        return cls(api.get_job(job_id))
+
+    @property
+    def id(self):
+        return self.job.get("id")
+
+    @property
+    def status(self):
+        """The job status name"""
+        return STATUS_JOB.get(self.job.get("status"), self.job.get("status"))
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def __getitem__(self, key):
+        """
+        The magnitude of the data at (section, name) as a read only numpy array
+        """
+        array = self._arrays.get(key)
+        if array is None:
+            value = self._values[key]
+            array = np.asarray(value["magnitude"]).reshape(value["shape"])
+            array.flags.writeable = False
+            self._arrays[key] = array
+        return array
+
+    def get(self, section, name, default=None):
+        if (section, name) not in self._values:
+            return default
+        return self[section, name]
+
+    def units(self, section, name):
+        """
+        The units of the data at (section, name) as a list of Unit
+        """
+        return [Unit(u["name"], u["exponent"]) for u in self._values[section, name]["units"]]
+
+    def keys(self):
+        return self._values.keys()
+
+    def names(self, section):
+        """
+        The names of the data in a section
+        """
+        return [n for s, n in self._values if s == section]
+
+    def artifact(self, artifact_id):
+        return self._artifacts[artifact_id]
+
+    def artifacts(self, type=None):
+        """
+        All artifacts, or those of one type
+        """
+        if type is None:
+            return list(self._artifacts.values())
+        return list(self._artifacts_by_type.get(type, []))
@@ -0,0 +1,129 @@
+import logging
+import os
+
+LOAD_DEFAULT_INTERVAL_SECS = 10
+LOAD_DEFAULT_CPU_HIGH = 0.9
+LOAD_DEFAULT_CPU_LOW = 0.6
+LOAD_DEFAULT_MEMORY_LOW = 0.1
+LOAD_DEFAULT_MEMORY_HIGH = 0.25
+
+logger = logging.getLogger(__name__)
+
+
+def _read_cpu_times():
+    """
+    Busy and total jiffies from /proc/stat, or None if it is not available
+    """
+    try:
+        with open("/proc/stat") as f:
+            fields = [int(x) for x in f.readline().split()[1:]]
+    except OSError:
+        return None
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+    total = sum(fields)
+    return total - idle, total
+
+
+def available_memory_fraction():
+    """
+    MemAvailable / MemTotal from /proc/meminfo, or None if it is not available
+    """
+    try:
+        with open("/proc/meminfo") as f:
+            meminfo = dict(line.split(":", 1) for line in f.read().splitlines())
+        available = int(meminfo["MemAvailable"].split()[0])
+        total = int(meminfo["MemTotal"].split()[0])
+    except (OSError, KeyError, ValueError):
+        return None
+    return available / total
+
+
+class CpuMonitor:
+    """
+    CPU utilisation of the whole node between successive calls to utilisation().
+    Falls back to the one minute load average where /proc/stat is not available.
+    """
+
+    def __init__(self):
+        self._last = _read_cpu_times()
+
+    def utilisation(self):
+        current = _read_cpu_times()
+        if current is None or self._last is None:
+            return os.getloadavg()[0] / (os.cpu_count() or 1)
+
+        busy = current[0] - self._last[0]
+        total = current[1] - self._last[1]
+        self._last = current
+        if total <= 0:
+            return 0.0
+        return busy / total
+
+
+class PrefetchController:
+    """
+    Decides the channel prefetch count of a worker from node load, with
+    hysteresis between the high and low thresholds.
+
+    Under pressure (CPU above cpu_high or available memory below memory_low)
+    the prefetch is lowered by one and pausable queues are paused. Once
+    relieved (CPU below cpu_low and available memory above memory_high)
+    pausable queues are resumed, and the prefetch is raised by one if every
+    prefetched message is being worked on. In between nothing changes.
+
+    Args:
+        minimum: The lowest prefetch count
+        maximum: The highest prefetch count, defaults to the number of CPUs
+        interval: Seconds between decisions
+    """
+
+    def __init__(
+        self,
+        minimum=1,
+        maximum=None,
+        interval=LOAD_DEFAULT_INTERVAL_SECS,
+        cpu_high=LOAD_DEFAULT_CPU_HIGH,
+        cpu_low=LOAD_DEFAULT_CPU_LOW,
+        memory_low=LOAD_DEFAULT_MEMORY_LOW,
+        memory_high=LOAD_DEFAULT_MEMORY_HIGH,
+    ):
+        if maximum is None:
+            maximum = max(minimum, os.cpu_count() or 1)
+        if minimum < 1 or maximum < minimum:
+            raise ValueError(f"Invalid prefetch range {minimum}..{maximum}")
+
+        self.minimum = minimum
+        self.maximum = maximum
+        self.interval = interval
+        self._cpu_high = cpu_high
+        self._cpu_low = cpu_low
+        self._memory_low = memory_low
+        self._memory_high = memory_high
+        self.paused = False
+
+    def decide(self, prefetch, in_flight, cpu, memory):
+        """
+        Returns the new prefetch count and whether pausable queues should be paused
+
+        Args:
+            prefetch: The current prefetch count
+            in_flight: The number of messages currently being worked on
+            cpu: CPU utilisation between 0 and 1
+            memory: Available memory fraction between 0 and 1, or None if unknown
+        """
+        under_pressure = cpu > self._cpu_high or (
+            memory is not None and memory < self._memory_low
+        )
+        relieved = cpu < self._cpu_low and (
+            memory is None or memory > self._memory_high
+        )
+
+        if under_pressure:
+            self.paused = True
+            prefetch = max(self.minimum, prefetch - 1)
+        elif relieved:
+            self.paused = False
+            if in_flight >= prefetch:
+                prefetch = min(self.maximum, prefetch + 1)
+
+        return prefetch, self.paused
@@ -0,0 +1,52 @@
+import logging
+import platform
+import sys
+import threading
+
+LOGGING_LEVEL = logging.INFO
+
+logger = logging.getLogger()  # get the root logger?
+tld = threading.local()
+tld.job_id = "NoJobId"
+
+
+class HostnameFilter(logging.Filter):
+    """Used for logging the hostname
+    https://stackoverflow.com/a/55584223/20882432
+    """
+
+    hostname = platform.node()
+
+    def filter(self, record):
+        record.hostname = HostnameFilter.hostname
+        return True
+
+
+class DefaultIdLogFilter(logging.Filter):
+    """Used for logging the job id"""
+
+    def filter(self, record):
+        if not hasattr(tld, "job_id"):
+            record.id = "NoJobId"
+        else:
+            record.id = tld.job_id
+        return True
+
+
+stream_handler = logging.StreamHandler(stream=sys.stdout)
+stream_handler.addFilter(HostnameFilter())
+stream_handler.addFilter(DefaultIdLogFilter())
+stream_handler.setFormatter(
+    logging.Formatter(
+        "%(asctime)s - %(id)s - %(levelname)s - %(hostname)s - %(filename)s->%(funcName)s() - %(message)s"
+    )
+)
+
+
+def configure_logging(level=LOGGING_LEVEL):
+    """Set the root logger level and log to stdout.
+    Safe to call more than once, the stdout handler is only added once.
+    """
+    logger.setLevel(level)
+    if stream_handler not in logger.handlers:
+        logger.addHandler(stream_handler)
@@ -0,0 +1,223 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+
+PAYLOAD_DEFAULT_THRESHOLD_BYTES = 64 * 1024
+PAYLOAD_REFERENCE_KEY = "$payload"
+PAYLOAD_DEFAULT_RELEASE_TIMEOUT_SECS = 3600
+
+logger = logging.getLogger(__name__)
+
+
+def _checksum(array):
+    """
+    sha256 of the raw bytes of a C-contiguous array
+    """
+    return "sha256:" + hashlib.sha256(memoryview(np.ascontiguousarray(array)).cast("B")).hexdigest()
+
+
+def is_payload_reference(value):
+    return isinstance(value, dict) and PAYLOAD_REFERENCE_KEY in value
+
+
+class PayloadStore:
+    """
+    Stores large intermediate arrays as memory-mapped files under the
+    job directory so that messages passed between stages only carry a
+    small reference.
+
+    Args:
+        projects_path: The root projects path, payloads are written to
+            {projects_path}/jobs/{job_id}/payloads
+        threshold: Arrays smaller than this many bytes are left inline by pack()
+        release_timeout: Seconds after cleanup() that references still not
+            released are given up on and the job's payloads removed anyway
+    """
+
+    def __init__(
+        self,
+        projects_path,
+        threshold=PAYLOAD_DEFAULT_THRESHOLD_BYTES,
+        release_timeout=PAYLOAD_DEFAULT_RELEASE_TIMEOUT_SECS,
+    ):
+        self._projects_path = projects_path
+        self._threshold = threshold
+        self._release_timeout = release_timeout
+        self._lock = threading.Lock()
+        self._open = {}
+        # Job ids cleaned up while referenced, by the time cleanup() was called
+        self._completed = {}
+        # Job ids whose payload directory is being removed
+        self._removing = set()
+
+    def _payload_directory(self, job_id):
+        return os.path.join(f"{self._projects_path}", "jobs", f"{job_id}", "payloads")
+
+    def put(self, job_id, name, array):
+        """
+        Write an array to the store and return a reference to it
+        """
+        array = np.ascontiguousarray(array)
+        if array.dtype.hasobject:
+            raise ValueError(f"Payload {name} has an object dtype and cannot be mapped")
+
+        directory = self._payload_directory(job_id)
+        os.makedirs(directory, exist_ok=True)
+
+        filename = os.path.join(directory, f"{name}-{uuid.uuid4().hex}.npy")
+        temp_filename = f"{filename}.tmp"
+        with open(temp_filename, "wb") as f:
+            np.save(f, array, allow_pickle=False)
+        os.replace(temp_filename, filename)
+
+        return {
+            PAYLOAD_REFERENCE_KEY: {
+                "job_id": job_id,
+                "path": filename,
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "checksum": _checksum(array),
+            }
+        }
+
+    def get(self, reference, verify=False):
+        """
+        Map the array behind a reference without copying it.
+
+        Each call holds a reference on the job's payloads until release() is called.
+        """
+        ref = reference[PAYLOAD_REFERENCE_KEY]
+        job_id = ref["job_id"]
+
+        # Take the reference before mapping, so cleanup() cannot remove the file meanwhile
+        with self._lock:
+            if job_id in self._removing:
+                raise FileNotFoundError(f"Payloads of job {job_id} have been removed")
+            self._open[job_id] = self._open.get(job_id, 0) + 1
+
+        try:
+            array = np.load(ref["path"], mmap_mode="r", allow_pickle=False)
+
+            if array.dtype.str != ref["dtype"] or list(array.shape) != ref["shape"]:
+                raise ValueError(
+                    f"Payload {ref['path']} is {array.dtype.str}{list(array.shape)}, expected {ref['dtype']}{ref['shape']}"
+                )
+            if verify and _checksum(array) != ref["checksum"]:
+                raise ValueError(f"Payload {ref['path']} failed checksum verification")
+        except BaseException:
+            self.release(reference)
+            raise
+        return array
+
+    def release(self, reference):
+        """
+        Drop a reference taken by get()
+        """
+        job_id = reference[PAYLOAD_REFERENCE_KEY]["job_id"]
+        with self._lock:
+            count = self._open.get(job_id, 0) - 1
+            if count > 0:
+                self._open[job_id] = count
+                return
+            self._open.pop(job_id, None)
+            remove = self._completed.pop(job_id, None) is not None
+            if remove:
+                self._removing.add(job_id)
+        if remove:
+            self._remove(job_id)
+
+    def cleanup(self, job_id):
+        """
+        Remove a job's payloads once nothing in this process has them mapped.
+
+        References not released within release_timeout of this call are
+        abandoned, the payloads are removed at the next cleanup() after that.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                completed_id
+                for completed_id, completed_at in self._completed.items()
+                if now - completed_at >= self._release_timeout
+            ]
+            for completed_id in expired:
+                logger.warning(
+                    f"{self._open.pop(completed_id, 0)} payload references to job {completed_id} were never released"
+                )
+                del self._completed[completed_id]
+                self._removing.add(completed_id)
+
+            if self._open.get(job_id, 0) > 0:
+                logger.info(
+                    f"{self._open[job_id]} payload references to job {job_id} are held, removing its payloads once released"
+                )
+                self._completed.setdefault(job_id, now)
+                remove = False
+            else:
+                self._removing.add(job_id)
+                remove = True
+
+        for completed_id in expired:
+            self._remove(completed_id)
+        if remove:
+            self._remove(job_id)
+
+    def _remove(self, job_id):
+        """
+        Remove the payload directory of a job the caller added to _removing
+        """
+        directory = self._payload_directory(job_id)
+        try:
+            if os.path.isdir(directory):
+                logger.info(f"Removing payloads in {directory}")
+                shutil.rmtree(directory, ignore_errors=True)
+        finally:
+            with self._lock:
+                self._removing.discard(job_id)
+
+    def pack(self, job_id, value):
+        """
+        Replace any numpy arrays at or above the threshold in a (nested)
+        dict or list with payload references, smaller arrays become lists
+        so that the result can be JSON encoded
+        """
+        if isinstance(value, np.ndarray):
+            if value.nbytes >= self._threshold:
+                return self.put(job_id, "array", value)
+            return value.tolist()
+        if isinstance(value, dict):
+            return {k: self.pack(job_id, v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.pack(job_id, v) for v in value]
+        return value
+
+    def unpack(self, value, verify=False):
+        """
+        Replace payload references in a (nested) dict or list with mapped arrays
+        """
+        if is_payload_reference(value):
+            return self.get(value, verify)
+        if isinstance(value, dict):
+            return {k: self.unpack(v, verify) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.unpack(v, verify) for v in value]
+        return value
+
+    def release_all(self, value):
+        """
+        Release every payload reference in a (nested) dict or list
+        """
+        if is_payload_reference(value):
+            self.release(value)
+        elif isinstance(value, dict):
+            for v in value.values():
+                self.release_all(v)
+        elif isinstance(value, list):
+            for v in value:
+                self.release_all(v)
@@ -0,0 +1,129 @@
+import os
+import resource
+import sys
+import time
+
+from tinarm.api import NameQuantityPair, Quantity, Unit
+
+TELEMETRY_SECTION = "telemetry"
+
+# ru_maxrss is in kilobytes on Linux and bytes on macOS
+_MAXRSS_BYTES = 1 if sys.platform == "darwin" else 1024
+
+
+def _thread_io():
+    """
+    Bytes read from and written to storage by the calling thread,
+    or None where /proc/thread-self/io is not available
+    """
+    try:
+        with open("/proc/thread-self/io") as f:
+            counters = dict(line.split(": ") for line in f.read().splitlines())
+    except OSError:
+        return None
+    return int(counters["read_bytes"]), int(counters["write_bytes"])
+
+
+def _directory_size(path):
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def telemetry_section(stage):
+    """The job data section for the telemetry of one stage, e.g. telemetry_solver"""
+    return f"{TELEMETRY_SECTION}_{stage}"
+
+
+class ResourceUsage:
+    """
+    Context manager measuring the resources used by the calling thread.
+
+    Args:
+        directory: Optional job directory, its growth in bytes is recorded
+            so that output written by solver subprocesses is accounted for.
+            The directory is walked on entry and exit, so leave it out when
+            the growth is not needed.
+
+    Attributes:
+        wall_time: Elapsed time in seconds
+        cpu_time: CPU time of the calling thread in seconds
+        child_cpu_time: CPU time of child processes that finished in the meantime, in seconds.
+            This is process wide, so includes children of other jobs running concurrently.
+        process_peak_rss: The resident set size high-water mark, in bytes, of the whole
+            worker process and its children since they started, not of this job alone
+        bytes_read, bytes_written: Storage I/O of the calling thread in bytes (Linux only)
+        directory_growth: Growth of the job directory in bytes
+    """
+
+    def __init__(self, directory=None):
+        self._directory = directory
+        self.wall_time = None
+        self.cpu_time = None
+        self.child_cpu_time = None
+        self.process_peak_rss = None
+        self.bytes_read = None
+        self.bytes_written = None
+        self.directory_growth = None
+
+    def __enter__(self):
+        self._start_directory_size = self._directory_size()
+        self._start_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self._start_io = _thread_io()
+        self._start_cpu = time.thread_time()
+        self._start_wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall_time = time.perf_counter() - self._start_wall
+        self.cpu_time = time.thread_time() - self._start_cpu
+
+        io = _thread_io()
+        if io is not None and self._start_io is not None:
+            self.bytes_read = io[0] - self._start_io[0]
+            self.bytes_written = io[1] - self._start_io[1]
+
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.child_cpu_time = (children.ru_utime + children.ru_stime) - (
+            self._start_children.ru_utime + self._start_children.ru_stime
+        )
+        this = resource.getrusage(resource.RUSAGE_SELF)
+        self.process_peak_rss = max(this.ru_maxrss, children.ru_maxrss) * _MAXRSS_BYTES
+
+        if self._start_directory_size is not None:
+            self.directory_growth = self._directory_size() - self._start_directory_size
+
+        return False
+
+    def _directory_size(self):
+        if self._directory is None:
+            return None
+        return _directory_size(self._directory)
+
+    def to_name_quantity_pairs(self, section=TELEMETRY_SECTION):
+        """
+        Converts the measurements to a list of NameQuantityPairs, skipping
+        any that were not available on this platform. Give each stage of a
+        job its own section, see telemetry_section().
+        """
+        seconds = [Unit("second", 1)]
+        byte = [Unit("byte", 1)]
+        measurements = [
+            ("wall_time", self.wall_time, seconds),
+            ("cpu_time", self.cpu_time, seconds),
+            ("child_cpu_time", self.child_cpu_time, seconds),
+            ("process_peak_rss", self.process_peak_rss, byte),
+            ("bytes_read", self.bytes_read, byte),
+            ("bytes_written", self.bytes_written, byte),
+            ("directory_growth", self.directory_growth, byte),
+        ]
+        return [
+            NameQuantityPair(section, name, Quantity(value, units))
+            for name, value, units in measurements
+            if value is not None
+        ]
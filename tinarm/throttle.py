@@ -0,0 +1,281 @@
+import email.utils
+import logging
+import threading
+import time
+
+import requests
+
+# Requests per second and burst size by endpoint class
+THROTTLE_DEFAULT_LIMITS = {
+    "jobs": (20.0, 40),
+    "status": (20.0, 40),
+    "data": (50.0, 100),
+    "artifacts": (10.0, 20),
+}
+THROTTLE_DEFAULT_FAILURE_THRESHOLD = 5
+THROTTLE_DEFAULT_RESET_TIMEOUT_SECS = 30
+THROTTLE_DEFAULT_MAX_RETRIES = 5
+THROTTLE_DEFAULT_MAX_WAIT_SECS = 300
+THROTTLE_FIRST_BACKOFF_SECS = 0.5
+THROTTLE_MAX_BACKOFF_SECS = 30
+
+# Statuses that mean the request was not processed, so any method can be retried
+THROTTLE_RETRY_STATUSES = (429, 503)
+# Statuses that may have been processed, only idempotent methods are retried
+THROTTLE_RETRY_IDEMPOTENT_STATUSES = (500, 502, 504)
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised when an endpoint's circuit stays open for longer than the caller will wait"""
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second on average, in bursts of up to capacity
+    """
+
+    def __init__(self, rate, capacity):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, blocking until one is available. Returns the time waited.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._capacity, self._tokens + (now - self._updated) * self._rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+            waited += wait
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures. Once reset_timeout has
+    passed a single probe request is let through, its success closes the
+    circuit again and its failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if self._probing else "open"
+
+    def wait_time(self):
+        """
+        Seconds until a request may be sent, 0 if it may be sent now
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            remaining = self._opened_at + self._reset_timeout - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if self._probing:
+                return min(1.0, self._reset_timeout)
+            self._probing = True
+            return 0.0
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (
+                self._opened_at is None and self._failures >= self._failure_threshold
+            ):
+                self._opened_at = time.monotonic()
+                self._probing = False
+                self.times_opened += 1
+                logger.warning(f"Circuit opened after {self._failures} failures")
+
+
+def _retry_after(response):
+    """
+    Seconds from a Retry-After header, given as seconds or an HTTP date
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class Throttle:
+    """
+    Client side rate limiting, circuit breaking and retries for API requests,
+    kept separately for each endpoint class. Share one Throttle between every
+    Api in a process so that they back off together.
+
+    Args:
+        limits: dict of endpoint class to (requests per second, burst), merged with the defaults
+        failure_threshold: Consecutive failures that open an endpoint's circuit
+        reset_timeout: Seconds an open circuit waits before a probe request
+        max_retries: Retries of a request after a retryable failure
+        max_wait: The longest a request waits, for an open circuit or as told by
+            Retry-After, before CircuitOpenError
+    """
+
+    def __init__(
+        self,
+        limits=None,
+        failure_threshold=THROTTLE_DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout=THROTTLE_DEFAULT_RESET_TIMEOUT_SECS,
+        max_retries=THROTTLE_DEFAULT_MAX_RETRIES,
+        max_wait=THROTTLE_DEFAULT_MAX_WAIT_SECS,
+    ):
+        self._limits = {**THROTTLE_DEFAULT_LIMITS, **(limits or {})}
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._max_retries = max_retries
+        self._max_wait = max_wait
+        self._buckets = {}
+        self._breakers = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, endpoint):
+        with self._lock:
+            if endpoint not in self._buckets:
+                rate, burst = self._limits.get(endpoint, self._limits["jobs"])
+                self._buckets[endpoint] = TokenBucket(rate, burst)
+                self._breakers[endpoint] = CircuitBreaker(
+                    self._failure_threshold, self._reset_timeout
+                )
+                self._counters[endpoint] = dict.fromkeys(
+                    ("requests", "successes", "failures", "retries", "rejected"), 0
+                )
+                self._counters[endpoint]["waited_secs"] = 0.0
+            return self._buckets[endpoint], self._breakers[endpoint]
+
+    def _count(self, endpoint, counter, amount=1):
+        with self._lock:
+            self._counters[endpoint][counter] += amount
+
+    def request(self, endpoint, send, idempotent=True):
+        """
+        Send a request through the endpoint's rate limiter and circuit breaker.
+
+        Args:
+            endpoint: The endpoint class, e.g. "status", "data" or "artifacts"
+            send: Makes the request and returns the response
+            idempotent: Whether the request may be retried after a server error
+
+        Returns the response, which may still be an error once retries are exhausted.
+        Raises CircuitOpenError rather than wait longer than max_wait in total.
+        """
+        bucket, breaker = self._endpoint(endpoint)
+        backoff = THROTTLE_FIRST_BACKOFF_SECS
+        waited = 0.0
+        attempt = 0
+
+        while True:
+            wait = breaker.wait_time()
+            if wait > 0:
+                if waited + wait > self._max_wait:
+                    self._count(endpoint, "rejected")
+                    raise CircuitOpenError(f"Circuit for {endpoint} requests is open")
+                time.sleep(wait)
+                waited += wait
+                self._count(endpoint, "waited_secs", wait)
+                continue
+
+            self._count(endpoint, "waited_secs", bucket.acquire())
+            self._count(endpoint, "requests")
+
+            retry_after = None
+            try:
+                response = send()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if not idempotent or attempt >= self._max_retries:
+                    breaker.record_failure()
+                    self._count(endpoint, "failures")
+                    raise
+                response = None
+            except BaseException:
+                # Any other error still ends a half-open probe, so the circuit re-opens
+                breaker.record_failure()
+                self._count(endpoint, "failures")
+                raise
+            else:
+                status_code = response.status_code
+                retryable = status_code in THROTTLE_RETRY_STATUSES or (
+                    idempotent and status_code in THROTTLE_RETRY_IDEMPOTENT_STATUSES
+                )
+                if status_code < 500 and status_code != 429:
+                    breaker.record_success()
+                    self._count(endpoint, "successes")
+                    return response
+                if not retryable or attempt >= self._max_retries:
+                    breaker.record_failure()
+                    self._count(endpoint, "failures")
+                    return response
+                retry_after = _retry_after(response)
+
+            breaker.record_failure()
+            self._count(endpoint, "failures")
+            self._count(endpoint, "retries")
+            attempt += 1
+
+            wait = backoff if retry_after is None else retry_after
+            if retry_after is not None and waited + wait > self._max_wait:
+                self._count(endpoint, "rejected")
+                raise CircuitOpenError(
+                    f"{endpoint} request told to retry after {retry_after:.0f} s, longer than max_wait"
+                )
+            logger.warning(
+                f"{endpoint} request failed ({'no response' if response is None else response.status_code}), retry {attempt} in {wait:.1f} s"
+            )
+            time.sleep(wait)
+            waited += wait
+            self._count(endpoint, "waited_secs", wait)
+            backoff = min(backoff * 2, THROTTLE_MAX_BACKOFF_SECS)
+
+    def stats(self):
+        """
+        Counters and circuit state for each endpoint class
+        """
+        with self._lock:
+            return {
+                endpoint: {
+                    **counters,
+                    "circuit": self._breakers[endpoint].state,
+                    "circuit_opened": self._breakers[endpoint].times_opened,
+                }
+                for endpoint, counters in self._counters.items()
+            }
@@ -0,0 +1,214 @@
+import hashlib
+import logging
+import mmap
+import os
+import re
+import requests
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+TRANSFER_DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+TRANSFER_DEFAULT_WORKERS = 4
+TRANSFER_MAX_RETRIES = 5
+TRANSFER_FIRST_BACKOFF_SECS = 0.5
+TRANSFER_MAX_BACKOFF_SECS = 30
+TRANSFER_STREAM_BLOCK_SIZE = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def pooled_session(pool_size):
+    """
+    A requests.Session keeping up to pool_size connections per host open
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _hexdigest(checksum):
+    """Checksums may be given as "sha256:<hex>" or plain hex"""
+    return checksum.split(":", 1)[-1].lower()
+
+
+def file_sha256(filename):
+    h = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(TRANSFER_STREAM_BLOCK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _uploaded_bytes(response):
+    """
+    The number of bytes the server has, from the Range header of a 308 response
+    """
+    match = re.match(r"bytes=0-(\d+)", response.headers.get("Range", ""))
+    return int(match.group(1)) + 1 if match else 0
+
+
+def _send(throttle, send, **kwargs):
+    """
+    Make a request, through the "artifacts" endpoint class of a throttle.Throttle if given
+    """
+    if throttle is None:
+        return send(**kwargs)
+    return throttle.request("artifacts", lambda: send(**kwargs))
+
+
+def _backoff(retries):
+    return min(TRANSFER_FIRST_BACKOFF_SECS * 2 ** (retries - 1), TRANSFER_MAX_BACKOFF_SECS)
+
+
+def upload_file(
+    url, filename, chunk_size=TRANSFER_DEFAULT_CHUNK_SIZE, session=None, throttle=None
+):
+    """
+    Upload a file in chunks with Content-Range PUT requests, resuming from
+    the offset the server reports after a failure.
+
+    The server answers 308 with a Range header for an incomplete upload and
+    200 or 201 once it has the whole file. Only one chunk is held in memory.
+    After a connection error the server is asked for its offset again, with
+    exponential backoff, up to TRANSFER_MAX_RETRIES consecutive failures.
+    An empty request ("bytes */size") asks for the offset, it also completes
+    an empty file or one the server already has in full.
+
+    Requests go through the "artifacts" endpoint class of throttle if given.
+    """
+    session = session or requests
+    size = os.path.getsize(filename)
+    sha256 = file_sha256(filename)
+    headers = {"X-Content-SHA256": sha256}
+
+    # None means ask the server how much it already has, which is also how
+    # an interrupted upload resumes
+    offset = None
+    retries = 0
+    incomplete = 0
+    with open(filename, "rb") as f:
+        while True:
+            try:
+                if offset is None or offset >= size:
+                    response = _send(
+                        throttle,
+                        session.put,
+                        url=url,
+                        data=b"",
+                        headers={**headers, "Content-Range": f"bytes */{size}"},
+                    )
+                else:
+                    f.seek(offset)
+                    chunk = f.read(chunk_size)
+                    end = offset + len(chunk) - 1
+                    response = _send(
+                        throttle,
+                        session.put,
+                        url=url,
+                        data=chunk,
+                        headers={**headers, "Content-Range": f"bytes {offset}-{end}/{size}"},
+                    )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                retries += 1
+                if retries > TRANSFER_MAX_RETRIES:
+                    raise
+                wait = _backoff(retries)
+                logger.warning(
+                    f"Upload of {filename} interrupted at {offset or 0} bytes, resuming in {wait:.1f} s"
+                )
+                time.sleep(wait)
+                offset = None
+                continue
+
+            retries = 0
+            if response.status_code in (200, 201):
+                logger.info(f"Uploaded {size} bytes from {filename}")
+                return response
+            if response.status_code != 308:
+                response.raise_for_status()
+            offset = _uploaded_bytes(response)
+
+            if offset >= size:
+                # The server has every byte but has not completed the upload
+                incomplete += 1
+                if incomplete > TRANSFER_MAX_RETRIES:
+                    raise IOError(
+                        f"Server has all {size} bytes of {filename} but did not complete the upload"
+                    )
+                time.sleep(_backoff(incomplete))
+
+
+def _download_range(session, throttle, url, buffer, start, end):
+    response = _send(
+        throttle,
+        session.get,
+        url=url,
+        headers={"Range": f"bytes={start}-{end}"},
+        stream=True,
+    )
+    response.raise_for_status()
+    if response.status_code != 206:
+        raise IOError(f"Server ignored the range request for {url}")
+
+    position = start
+    for block in response.iter_content(TRANSFER_STREAM_BLOCK_SIZE):
+        buffer[position : position + len(block)] = block
+        position += len(block)
+    if position != end + 1:
+        raise IOError(f"Range {start}-{end} of {url} ended at {position}")
+
+
+def download_file(
+    url,
+    filename,
+    checksum=None,
+    workers=TRANSFER_DEFAULT_WORKERS,
+    chunk_size=TRANSFER_DEFAULT_CHUNK_SIZE,
+    session=None,
+    throttle=None,
+):
+    """
+    Download a url to filename with parallel range requests written straight
+    into a memory map of the destination, so the file is never held in memory.
+    Falls back to a single streamed request when the server does not support
+    ranges. The sha256 checksum is verified if given. Requests go through
+    the "artifacts" endpoint class of throttle if given.
+    """
+    session = session or pooled_session(workers)
+    head = _send(throttle, session.head, url=url, allow_redirects=True)
+    head.raise_for_status()
+    size = int(head.headers.get("Content-Length", -1))
+    ranges_supported = head.headers.get("Accept-Ranges") == "bytes"
+
+    if size > 0 and ranges_supported:
+        with open(filename, "wb+") as f:
+            f.truncate(size)
+            with mmap.mmap(f.fileno(), size) as buffer:
+                ranges = [
+                    (start, min(start + chunk_size, size) - 1)
+                    for start in range(0, size, chunk_size)
+                ]
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = [
+                        executor.submit(_download_range, session, throttle, url, buffer, *r)
+                        for r in ranges
+                    ]
+                    for future in futures:
+                        future.result()
+                buffer.flush()
+    else:
+        response = _send(throttle, session.get, url=url, stream=True)
+        response.raise_for_status()
+        with open(filename, "wb") as f:
+            for block in response.iter_content(TRANSFER_STREAM_BLOCK_SIZE):
+                f.write(block)
+
+    if checksum is not None and file_sha256(filename) != _hexdigest(checksum):
+        os.remove(filename)
+        raise IOError(f"Checksum mismatch downloading {url}")
+
+    logger.info(f"Downloaded {os.path.getsize(filename)} bytes to {filename}")
+    return filename
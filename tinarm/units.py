@@ -0,0 +1,93 @@
+import functools
+
+from tinarm.api import Quantity, Unit, _magnitude_and_shape
+
+
+def _exponent(exponent):
+    """pint reports derived exponents as floats, keep whole ones as int"""
+    return int(exponent) if float(exponent).is_integer() else exponent
+
+
+@functools.lru_cache(maxsize=None)
+def _conversion(registry, units):
+    """
+    The scale, offset and SI units for a unit signature, so that
+    magnitude_si = magnitude * scale + offset.
+    The offset is only non zero for units such as degree_Celsius.
+    """
+    zero = registry.Quantity(0.0, units).to_base_units()
+    one = registry.Quantity(1.0, units).to_base_units()
+    si_units = tuple(Unit(name, _exponent(e)) for name, e in one.unit_items())
+    return one.magnitude - zero.magnitude, zero.magnitude, si_units
+
+
+def to_si(quantity):
+    """
+    Converts a pint quantity to its magnitude in SI base units and a list of Unit.
+
+    Conversion factors are cached per unit signature and array magnitudes are
+    converted in a single numpy operation, so pint is only consulted the first
+    time a unit is seen.
+    """
+    scale, offset, units = _conversion(quantity._REGISTRY, quantity._units)
+    magnitude = quantity.magnitude
+    if scale != 1 or offset != 0:
+        magnitude = magnitude * scale + offset
+    if getattr(magnitude, "shape", None) == ():
+        magnitude = magnitude.item()
+    return magnitude, list(units)
+
+
+@functools.lru_cache(maxsize=None)
+def _units(units):
+    """
+    The Unit objects of a unit signature, in the order pint lists them
+    """
+    return tuple(Unit(name, exponent) for name, exponent in units.items())
+
+
+def to_units(quantity):
+    """
+    Splits a pint quantity into its magnitude and a list of Unit, in its own
+    units, as Quantity(*quantity.to_tuple()) would. The Unit list is cached
+    per unit signature.
+    """
+    return quantity.magnitude, list(_units(quantity._units))
+
+
+def to_api_quantity(quantity, si=False):
+    """
+    Converts a pint quantity to an API Quantity, in its own units or in SI
+    base units if si is True
+    """
+    return Quantity(*(to_si(quantity) if si else to_units(quantity)))
+
+
+def to_api_dict(quantity, si=False):
+    """
+    Encodes a pint quantity straight to the API dict of a Quantity, in its own
+    units or in SI base units if si is True, without building Quantity objects
+    """
+    magnitude, units = to_si(quantity) if si else to_units(quantity)
+    magnitude, shape = _magnitude_and_shape(magnitude)
+    return {
+        "magnitude": magnitude,
+        "shape": shape,
+        "units": [u.to_dict() for u in units],
+    }
+
+
+def to_api_data(section, quantities, si=False):
+    """
+    Encodes a dict of name to pint quantity as the API data of a section,
+    the dicts NameQuantityPair.to_dict() would give
+    """
+    return [
+        {"section": section, "name": name, "value": to_api_dict(quantity, si)}
+        for name, quantity in quantities.items()
+    ]
+
+
+def clear_cache():
+    _conversion.cache_clear()
+    _units.cache_clear()
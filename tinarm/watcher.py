@@ -0,0 +1,251 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from tinarm.api import STATUS_JOB
+
+WATCHER_DEFAULT_INTERVAL_SECS = 10
+WATCHER_DEFAULT_MAX_WORKERS = 8
+WATCHER_FINAL_STATUSES = ("Complete", "Quarantined")
+WATCHER_CATCH_ALL_ROUTING_KEYS = ("#", "*.#", "#.*")
+
+# Seconds between polls of a job, by its last seen status. Jobs waiting in a
+# solver queue change slowly, jobs close to completion are polled often.
+WATCHER_DEFAULT_INTERVALS = {
+    "New": 5,
+    "QueuedForMeshing": 10,
+    "WaitingForMesh": 10,
+    "QueuedForSimSetup": 10,
+    "SimSetup": 5,
+    "QueuedForMeshConversion": 10,
+    "MeshConversion": 5,
+    "QueuedForSolving": 30,
+    "Solving": 10,
+    "QueuedForPostProcess": 5,
+    "PostProcess": 2,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def _status_name(status):
+    """Status names are used throughout, the API returns the numeric value"""
+    return STATUS_JOB.get(status, status)
+
+
+class _WatchedJob:
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.status = None
+        self.next_poll = 0.0
+        self.future = Future()
+
+
+class JobWatcher:
+    """
+    Tracks the status of many jobs.
+
+    Each job is polled with Api.get_job at an interval that depends on its
+    last seen status, and only jobs that are due are polled, concurrently
+    on a bounded thread pool. Polls revalidate, so with an Api created with
+    a cache_ttl each poll is a conditional request and an unchanged job costs
+    a 304 rather than the whole job. Status events from the AMQP topic exchange
+    can be fed in with subscribe() or update() to avoid waiting for a poll.
+
+    Changes are reported to callbacks registered with on_change(), to the
+    futures returned by watch(), which resolve with the final status name,
+    and to async iterators from changes().
+
+    Args:
+        api: The Api used to poll jobs
+        intervals: Seconds between polls by status name, merged with the defaults
+        max_workers: The most get_job requests in flight at once
+
+    Call close() when finished with the watcher to stop its poll threads.
+    """
+
+    def __init__(self, api, intervals=None, max_workers=WATCHER_DEFAULT_MAX_WORKERS):
+        self._api = api
+        self._intervals = {**WATCHER_DEFAULT_INTERVALS, **(intervals or {})}
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="JobWatcher"
+        )
+        self._jobs = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def watch(self, job_ids):
+        """
+        Start watching jobs, returns a dict of job id to Future
+        """
+        with self._lock:
+            for job_id in job_ids:
+                if job_id not in self._jobs:
+                    self._jobs[job_id] = _WatchedJob(job_id)
+            return {job_id: self._jobs[job_id].future for job_id in job_ids}
+
+    def future(self, job_id):
+        return self._jobs[job_id].future
+
+    def status(self, job_id):
+        """The last seen status name of a job, None if not seen yet"""
+        return self._jobs[job_id].status
+
+    def done(self):
+        """True once every watched job has reached a final status"""
+        with self._lock:
+            return all(job.future.done() for job in self._jobs.values())
+
+    def on_change(self, callback):
+        """
+        Register callback(job_id, old_status, new_status), called on the
+        thread that saw the change
+        """
+        with self._lock:
+            self._callbacks.append(callback)
+
+    def update(self, job_id, status):
+        """
+        Record a job status from any source, status may be a name or value
+        """
+        status = _status_name(status)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.next_poll = time.monotonic() + self._intervals.get(
+                status, WATCHER_DEFAULT_INTERVAL_SECS
+            )
+            if job.status == status:
+                return
+            old_status = job.status
+            job.status = status
+            callbacks = list(self._callbacks)
+
+        logger.info(f"Job {job_id} status {old_status} -> {status}")
+        for callback in callbacks:
+            try:
+                callback(job_id, old_status, status)
+            except Exception as e:
+                logger.error(f"Job status callback failed: {e}")
+
+        if status in WATCHER_FINAL_STATUSES and not job.future.done():
+            job.future.set_result(status)
+
+    def _poll_job(self, job_id):
+        try:
+            self.update(job_id, self._api.get_job(job_id, revalidate=True)["status"])
+        except Exception as e:
+            logger.warning(f"Failed to poll job {job_id}: {e}")
+            with self._lock:
+                self._jobs[job_id].next_poll = (
+                    time.monotonic() + WATCHER_DEFAULT_INTERVAL_SECS
+                )
+
+    def poll(self):
+        """
+        Poll every job that is due, returns the number of jobs polled
+        """
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                job.job_id
+                for job in self._jobs.values()
+                if not job.future.done() and job.next_poll <= now
+            ]
+            # Do not poll again before this round has been seen
+            for job_id in due:
+                self._jobs[job_id].next_poll = now + WATCHER_DEFAULT_INTERVAL_SECS
+
+        if due:
+            list(self._executor.map(self._poll_job, due))
+        return len(due)
+
+    def _next_due(self):
+        with self._lock:
+            pending = [j.next_poll for j in self._jobs.values() if not j.future.done()]
+        return min(pending, default=None)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.poll()
+            next_due = self._next_due()
+            wait = 1.0 if next_due is None else next_due - time.monotonic()
+            self._stop.wait(min(max(wait, 0.0), 1.0))
+
+    def start(self):
+        """
+        Poll in a background thread until stop() is called
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        """
+        Stop polling and shut down the poll thread pool
+        """
+        self.stop()
+        self._executor.shutdown()
+
+    def subscribe(self, channel, routing_key, exchange="amq.topic"):
+        """
+        Consume job status events from a topic exchange on a pika channel.
+        Messages are JSON bodies with the job "id" and its "status".
+
+        The routing key must match status events only. Workers publish every
+        log record to amq.topic, so a catch-all key such as "#" would consume
+        and parse the logs of the whole fleet.
+        """
+        if routing_key in WATCHER_CATCH_ALL_ROUTING_KEYS:
+            raise ValueError(f"Routing key {routing_key!r} matches every message")
+
+        result = channel.queue_declare(queue="", exclusive=True, auto_delete=True)
+        queue = result.method.queue
+        channel.queue_bind(exchange=exchange, queue=queue, routing_key=routing_key)
+
+        def on_message(_ch, _method, _properties, body):
+            try:
+                event = json.loads(body)
+                self.update(event["id"], event["status"])
+            except (ValueError, KeyError, TypeError):
+                pass
+
+        channel.basic_consume(queue=queue, on_message_callback=on_message, auto_ack=True)
+        logger.info(f"Watching job status events, Q::RK, {queue}::{routing_key}")
+
+    async def changes(self):
+        """
+        Async iterator of (job_id, old_status, new_status) tuples, ending once
+        every job watched when iteration started has reached a final status
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def forward(*change):
+            loop.call_soon_threadsafe(queue.put_nowait, change)
+
+        self.on_change(forward)
+        with self._lock:
+            pending = {j.job_id for j in self._jobs.values() if not j.future.done()}
+        try:
+            while pending:
+                change = await queue.get()
+                if change[2] in WATCHER_FINAL_STATUSES:
+                    pending.discard(change[0])
+                yield change
+        finally:
+            with self._lock:
+                self._callbacks.remove(forward)
@@ -1,11 +1,15 @@
+import cProfile
 import functools
+import gzip
+import io
 import json
 import logging
 import os
 import pika
 import platform
+import pstats
+import signal
 import ssl
-import sys
 import threading
 import time
 
@@ -13,53 +17,92 @@ from pathlib import Path
 from python_logging_rabbitmq import RabbitMQHandler
 
 from tinarm.api import Api
+from tinarm.checkpoint import Checkpoint, JobInterrupted
+from tinarm.load import CpuMonitor, PrefetchController, available_memory_fraction
+from tinarm.log import (
+    LOGGING_LEVEL,
+    DefaultIdLogFilter,
+    HostnameFilter,
+    configure_logging,
+    stream_handler,
+    tld,
+)
+from tinarm.payload import PayloadStore
+from tinarm.telemetry import ResourceUsage, telemetry_section
+from tinarm.throttle import Throttle
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 RABBIT_DEFAULT_PRE_FETCH_COUNT = 1
 RABBIT_FIRST_WAIT_BEFORE_RERTY_SECS = 0.5
 RABBIT_MAX_WAIT_BEFORE_RERTY_SECS = 64
-LOGGING_LEVEL = logging.INFO
+RABBIT_COMPRESSION_THRESHOLD_BYTES = 64 * 1024
+# zstd is faster but every consumer must have zstandard installed, so it is opt-in.
+# Consumers decode any encoding before publishers start using it, so in a fleet
+# with workers older than message compression publish with None until all are upgraded.
+RABBIT_DEFAULT_CONTENT_ENCODING = "gzip"
+RABBIT_CONTENT_ENCODINGS = (None, "gzip", "zstd")
+RABBIT_PROCESS_EVENTS_SECS = 1
+PROFILE_HEADER = "x-tinarm-profile"
+PROFILE_SUMMARY_LINES = 25
 
 
-### Configure Logging
 logger = logging.getLogger()  # get the root logger?
-logger.setLevel(LOGGING_LEVEL)
-tld = threading.local()
-tld.job_id = "NoJobId"
+_profile_lock = threading.Lock()
 
 
-class HostnameFilter(logging.Filter):
-    """Used for logging the hostname
-    https://stackoverflow.com/a/55584223/20882432
+def current_checkpoint():
+    """The Checkpoint of the job the calling callback is processing, None
+    outside a StandardWorker callback. Load it to resume a redelivered job,
+    save it as work progresses and call check() so the job stops promptly
+    when the worker drains.
     """
+    return getattr(tld, "checkpoint", None)
 
-    hostname = platform.node()
-
-    def filter(self, record):
-        record.hostname = HostnameFilter.hostname
-        return True
 
+class _Consumer:
+    """A queue consumer registered by StandardWorker.bind"""
 
-class DefaultIdLogFilter(logging.Filter):
-    """Used for logging the job id"""
-
-    def filter(self, record):
-        if not hasattr(tld, "job_id"):
-            record.id = "NoJobId"
-        else:
-            record.id = tld.job_id
-        return True
-
-
-stream_handler = logging.StreamHandler(stream=sys.stdout)
-stream_handler.addFilter(HostnameFilter())
-stream_handler.addFilter(DefaultIdLogFilter())
-stream_handler.setFormatter(
-    logging.Formatter(
-        "%(asctime)s - %(id)s - %(levelname)s - %(hostname)s - %(filename)s->%(funcName)s() - %(message)s"
-    )
-)
+    def __init__(
+        self,
+        channel,
+        queue,
+        on_message_callback,
+        arguments,
+        pausable,
+        max_concurrency=None,
+        weight=None,
+    ):
+        self.channel = channel
+        self.queue = queue
+        self.on_message_callback = on_message_callback
+        self.arguments = arguments
+        self.pausable = pausable
+        self.max_concurrency = max_concurrency
+        self.weight = weight
+        self.prefetch_count = None
+        self.paused = False
+        self.consumer_tag = None
+
+    @property
+    def dedicated(self):
+        """Queues with a concurrency cap or weight have a channel of their own"""
+        return self.max_concurrency is not None or self.weight is not None
+
+    def consume(self):
+        self.consumer_tag = self.channel.basic_consume(
+            queue=self.queue,
+            on_message_callback=self.on_message_callback,
+            arguments=self.arguments,
+        )
+        self.paused = False
 
-logger.addHandler(stream_handler)
+    def pause(self):
+        self.channel.basic_cancel(self.consumer_tag)
+        self.paused = True
 
 
 class StandardWorker:
@@ -80,7 +123,22 @@ class StandardWorker:
         queue_prefetch_count=RABBIT_DEFAULT_PRE_FETCH_COUNT,
         x_priority=0,
         projects_path=os.getenv("PROJECTS_PATH"),
+        profile_jobs=False,
+        adaptive_prefetch=False,
+        min_prefetch_count=1,
+        max_prefetch_count=None,
+        api_throttle=None,
+        compress_checkpoints=False,
+        message_encoding=RABBIT_DEFAULT_CONTENT_ENCODING,
+        send_telemetry=False,
     ):
+        configure_logging()
+
+        if message_encoding not in RABBIT_CONTENT_ENCODINGS:
+            raise ValueError(f"Unsupported message encoding {message_encoding}")
+        if message_encoding == "zstd" and zstandard is None:
+            raise ValueError("zstd message encoding needs the zstandard package")
+
         self._threads = []
         self._node_id = node_id
         self._worker_name = worker_name
@@ -88,6 +146,34 @@ class StandardWorker:
         self._x_priority = x_priority
         self._projects_path = projects_path
         self._send_log_as_artifact = True
+        # Telemetry costs a job data request per measurement for every stage, so it is opt-in
+        self._send_telemetry = send_telemetry
+        self._profile_jobs = profile_jobs
+        self.payloads = PayloadStore(projects_path)
+        # One throttle for every API call made by this worker's threads, callbacks
+        # can pass it to their own Api so that they back off together
+        self.api_throttle = api_throttle or Throttle()
+        self._consumers = {}
+        self._prefetch_count = queue_prefetch_count
+        self._compress_checkpoints = compress_checkpoints
+        self._message_encoding = message_encoding
+        self._draining = threading.Event()
+
+        # Optionally adjust the prefetch count and pause queues according to node
+        # load, starting from queue_prefetch_count
+        if adaptive_prefetch:
+            if max_prefetch_count is None:
+                max_prefetch_count = max(queue_prefetch_count, os.cpu_count() or 1)
+            self._prefetch_controller = PrefetchController(
+                minimum=min_prefetch_count, maximum=max_prefetch_count
+            )
+            if not min_prefetch_count <= queue_prefetch_count <= max_prefetch_count:
+                raise ValueError(
+                    f"queue_prefetch_count {queue_prefetch_count} is outside {min_prefetch_count}..{max_prefetch_count}"
+                )
+            self._cpu_monitor = CpuMonitor()
+        else:
+            self._prefetch_controller = None
 
         if queue_use_ssl:
             ssl_options = pika.SSLOptions(context=ssl.create_default_context())
@@ -105,7 +191,13 @@ class StandardWorker:
         )
 
         self._channel = self._connection.channel()
-        self._channel.basic_qos(prefetch_count=queue_prefetch_count, global_qos=False)
+        if self._prefetch_controller is None:
+            self._channel.basic_qos(prefetch_count=queue_prefetch_count, global_qos=False)
+        else:
+            # The adaptive limit is channel wide, so changing it applies at once
+            # and messages already unacked count against the new limit
+            self._channel.basic_qos(prefetch_count=max_prefetch_count, global_qos=False)
+            self._channel.basic_qos(prefetch_count=queue_prefetch_count, global_qos=True)
         self._channel.exchange_declare(
             exchange=queue_exchange, exchange_type="topic", durable=True
         )
@@ -138,8 +230,44 @@ class StandardWorker:
 
         logger.addHandler(rabbit_handler)
 
-    def bind(self, queue, routing_key, func):
-        ch = self._channel
+    def bind(
+        self,
+        queue,
+        routing_key,
+        func,
+        pause_under_pressure=False,
+        max_concurrency=None,
+        weight=None,
+    ):
+        """
+        Declare a queue, bind it to the exchange and consume it with func.
+
+        Args:
+            pause_under_pressure: Let the adaptive prefetch controller pause this queue
+            max_concurrency: The most messages from this queue worked on at once
+            weight: This queue's share of the worker's prefetch count, relative
+                to the other weighted queues. Every weighted queue gets at least one.
+
+        Queues with a max_concurrency or weight are consumed on a channel of their
+        own, so a flood on one of them cannot starve the others.
+
+        Weighted shares are fixed, a share left idle by one queue is not lent to
+        the others, so a long solve queue does not take over the slots of an empty
+        post-processing queue. The limit of each dedicated channel is on top of the
+        worker channel's, so up to the prefetch count plus every dedicated limit
+        can be in flight at once. Size queue_prefetch_count and the caps together.
+        """
+        if func is not None and queue in self._consumers:
+            raise ValueError(f"Queue {queue} is already consumed by this worker")
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError(f"max_concurrency of {queue} must be at least 1")
+        if weight is not None and not weight > 0:
+            raise ValueError(f"weight of {queue} must be positive")
+
+        if max_concurrency is not None or weight is not None:
+            ch = self._connection.channel()
+        else:
+            ch = self._channel
 
         ch.queue_declare(
             queue=queue,
@@ -150,42 +278,149 @@ class StandardWorker:
 
         # If func was provided, register the callback
         if func is not None:
-            ch.basic_consume(
-                queue=queue,
+            consumer = _Consumer(
+                ch,
+                queue,
                 on_message_callback=functools.partial(
                     self._threaded_callback,
                     args=(func, self._connection, ch, self._threads),
                 ),
                 arguments={"x-priority": self._x_priority},
+                pausable=pause_under_pressure,
+                max_concurrency=max_concurrency,
+                weight=weight,
             )
+            self._consumers[queue] = consumer
+            self._balance_queues()
+            consumer.consume()
 
         logger.info(f"Declare::Bind, Q::RK, {queue}::{routing_key}")
 
     def start(self):
+        if self._prefetch_controller is not None:
+            self._connection.call_later(
+                self._prefetch_controller.interval, self._adapt_prefetch
+            )
+
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self._on_sigterm)
+
+        # Consumers may be on several channels, or all paused, so drive the
+        # connection rather than a single channel's start_consuming
+        self._consuming = True
         try:
             logger.info("Starting to consume messages")
-            self._channel.start_consuming()
+            while self._consuming:
+                self._connection.process_data_events(
+                    time_limit=RABBIT_PROCESS_EVENTS_SECS
+                )
         except KeyboardInterrupt:
-            logger.info("Stopping consuming ...")
-            self._channel.stop_consuming()
-            logger.info("Stopped consuming messages")
+            pass
+
+        logger.info("Stopping consuming ...")
+        for consumer in self._consumers.values():
+            if not consumer.paused:
+                consumer.pause()
+        logger.info("Stopped consuming messages")
 
-        # Wait for all to complete
-        for thread in self._threads:
-            thread.join()
+        # Wait for all to complete, their acks, nacks and next stage messages
+        # are sent by the connection so keep processing its events meanwhile
+        while any(thread.is_alive() for thread in self._threads):
+            self._connection.process_data_events(time_limit=RABBIT_PROCESS_EVENTS_SECS)
+        self._connection.process_data_events(time_limit=0)
 
         # Close connection
         self._connection.close()
 
+    def drain(self):
+        """
+        Stop taking messages and ask running callbacks to checkpoint and stop,
+        their messages are requeued. start() returns once they have finished.
+        """
+        logger.warning("Draining, in flight jobs will be checkpointed and requeued")
+        self._draining.set()
+        self._consuming = False
+
+    def _on_sigterm(self, signum, frame):
+        self.drain()
+
     def queue_message(self, routing_key, body):
-        _rabbitmq_queue_message(self._channel, self._exchange, routing_key, body)
+        _rabbitmq_queue_message(
+            self._channel, self._exchange, routing_key, body, self._message_encoding
+        )
+
+    def _balance_queues(self):
+        """Set the prefetch count of each dedicated queue channel from its
+        concurrency cap and its weighted share of the worker's prefetch count,
+        never more than the adaptive prefetch count
+        """
+        if self._draining.is_set():
+            return
 
-    def _threaded_callback(self, ch, method_frame, _header_frame, body, args):
+        total_weight = sum(
+            c.weight for c in self._consumers.values() if c.weight is not None
+        )
+
+        for queue, consumer in self._consumers.items():
+            if not consumer.dedicated:
+                continue
+
+            prefetch = consumer.max_concurrency
+            if consumer.weight is not None:
+                share = max(1, int(self._prefetch_count * consumer.weight / total_weight))
+                prefetch = share if prefetch is None else min(prefetch, share)
+            if self._prefetch_controller is not None:
+                # Under load the controller's prefetch count bounds every queue
+                prefetch = min(prefetch, self._prefetch_count)
+
+            if prefetch != consumer.prefetch_count:
+                logger.info(f"Prefetch for {queue}: {prefetch}")
+                # Channel wide, the channel only has this consumer, so the new
+                # limit applies at once and counts messages already unacked
+                consumer.channel.basic_qos(prefetch_count=prefetch, global_qos=True)
+                consumer.prefetch_count = prefetch
+
+    def _adapt_prefetch(self):
+        """Runs on the connection thread every controller interval"""
+        # A draining worker keeps processing connection events, it must not
+        # resume the queues start() paused, nor schedule itself again
+        if self._draining.is_set():
+            return
+
+        controller = self._prefetch_controller
+
+        # Forget finished threads, the remainder are the messages in flight
+        self._threads[:] = [t for t in self._threads if t.is_alive()]
+        in_flight = len(self._threads)
+        cpu = self._cpu_monitor.utilisation()
+        memory = available_memory_fraction()
+
+        prefetch, paused = controller.decide(self._prefetch_count, in_flight, cpu, memory)
+        load = f"CPU {cpu:.0%}, memory available {'unknown' if memory is None else f'{memory:.0%}'}, in flight {in_flight}"
+
+        if prefetch != self._prefetch_count:
+            logger.info(f"Prefetch {self._prefetch_count} -> {prefetch}: {load}")
+            self._channel.basic_qos(prefetch_count=prefetch, global_qos=True)
+            self._prefetch_count = prefetch
+            self._balance_queues()
+
+        for queue, consumer in self._consumers.items():
+            if consumer.pausable and consumer.paused != paused:
+                if paused:
+                    logger.warning(f"Pausing consumption of {queue}: {load}")
+                    consumer.pause()
+                else:
+                    logger.info(f"Resuming consumption of {queue}: {load}")
+                    consumer.consume()
+
+        self._connection.call_later(controller.interval, self._adapt_prefetch)
+
+    def _threaded_callback(self, ch, method_frame, header_frame, body, args):
         (func, conn, ch, thrds) = args
         delivery_tag = method_frame.delivery_tag
         t = threading.Thread(
             target=self._do_threaded_callback,
-            args=(conn, ch, delivery_tag, func, body),
+            args=(conn, ch, delivery_tag, func, body, header_frame),
         )
         t.start()
         thrds.append(t)
@@ -193,19 +428,38 @@ class StandardWorker:
             "Thread count: %i of which %i active", len(thrds), threading.active_count()
         )
 
-    def _do_threaded_callback(self, conn, ch, delivery_tag, func, body):
+    def _do_threaded_callback(self, conn, ch, delivery_tag, func, body, properties=None):
 
         thread_id = threading.get_ident()
+        headers = {}
+        if properties is not None:
+            body = _decode_body(body, properties.content_encoding)
+            headers = properties.headers or {}
         payload = json.loads(body.decode())
         tld.job_id = payload["id"]
 
         api_root = os.getenv("API_ROOT_URL")
         api_key = payload.get("apikey", None)
 
-        can_send_log_as_artifact = self._send_log_as_artifact and api_root and api_key
+        can_use_api = api_root and api_key
+        can_send_log_as_artifact = self._send_log_as_artifact and can_use_api
 
         job_log_directory = f"{self._projects_path}/jobs/{tld.job_id}"
         job_log_filename = f"{job_log_directory}/{self._worker_name}.log"
+        job_profile_filename = f"{job_log_directory}/{self._worker_name}.prof"
+
+        # Callbacks save their progress here with current_checkpoint()
+        tld.checkpoint = Checkpoint(
+            job_log_directory,
+            self._worker_name,
+            compress=self._compress_checkpoints,
+            draining=self._draining,
+        )
+
+        # Profiling can be enabled for the worker, or per message in the body or a header
+        profile = bool(
+            self._profile_jobs or payload.get("profile") or headers.get(PROFILE_HEADER)
+        )
 
         if can_send_log_as_artifact:
 
@@ -232,28 +486,115 @@ class StandardWorker:
             tld.job_id,
         )
 
-        next_routing_key, new_body = func(body)
+        # Walking the job directory for its growth is only worth it if sent
+        send_telemetry = self._send_telemetry and can_use_api
+        try:
+            with ResourceUsage(job_log_directory if send_telemetry else None) as usage:
+                if profile:
+                    Path(job_log_directory).mkdir(parents=True, exist_ok=True)
+                    next_routing_key, new_body = _profiled_call(
+                        func, body, job_profile_filename
+                    )
+                else:
+                    next_routing_key, new_body = func(body)
+        except JobInterrupted as e:
+            # Leave the checkpoint for whichever worker gets the message next
+            logger.warning(f"Job interrupted, requeueing message: {e}")
+            cb = functools.partial(_rabbitmq_nack_message, ch, delivery_tag)
+            conn.add_callback_threadsafe(cb)
+            if can_send_log_as_artifact:
+                logger.removeHandler(file_handler)
+            return
+        finally:
+            checkpoint = tld.checkpoint
+            tld.checkpoint = None
+
+        checkpoint.clear()
         if new_body is not None:
             body = new_body
         if next_routing_key is not None:
             logger.info(f"next routing key: {next_routing_key}")
             cbq = functools.partial(self.queue_message, next_routing_key, body)
             conn.add_callback_threadsafe(cbq)
+        else:
+            # Last stage for this job, intermediate payloads are no longer needed
+            self.payloads.cleanup(tld.job_id)
 
         cb = functools.partial(_rabbitmq_ack_message, ch, delivery_tag)
         conn.add_callback_threadsafe(cb)
 
+        logger.info(
+            "Wall time: %.3f s CPU time: %.3f s Process peak RSS: %i bytes",
+            usage.wall_time,
+            usage.cpu_time,
+            usage.process_peak_rss,
+        )
+        if send_telemetry:
+            try:
+                api = Api(
+                    root_url=api_root,
+                    api_key=api_key,
+                    node_id=self._node_id,
+                    throttle=self.api_throttle,
+                )
+                section = telemetry_section(self._worker_name)
+                for data in usage.to_name_quantity_pairs(section):
+                    api.create_job_data(tld.job_id, data)
+            except Exception as e:
+                logger.error(f"Failed to send job telemetry: {e}")
+
         if can_send_log_as_artifact:
             logger.removeHandler(file_handler)
             try:
                 logger.info("Creating artifact from job log")
-                api = Api(root_url=api_root, api_key=api_key, node_id=self._node_id)
+                api = Api(
+                    root_url=api_root,
+                    api_key=api_key,
+                    node_id=self._node_id,
+                    throttle=self.api_throttle,
+                )
                 api.create_job_artifact_from_file(
                     tld.job_id, f"{self._worker_name}_log", job_log_filename
                 )
             except Exception as e:
                 logger.error(f"Failed to create artifact from job log: {e}")
 
+            # The profile is skipped if another job was being profiled
+            if profile and os.path.isfile(job_profile_filename):
+                try:
+                    logger.info("Creating artifact from job profile")
+                    api.create_job_artifact_from_file(
+                        tld.job_id, f"{self._worker_name}_profile", job_profile_filename
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to create artifact from job profile: {e}")
+
+
+def _profiled_call(func, body, filename, lines=PROFILE_SUMMARY_LINES):
+    """Run func(body) under cProfile, dump the stats to filename and log
+    the functions with the highest cumulative time.
+
+    Only one profiler can be active in a process (from Python 3.12 cProfile
+    takes the single sys.monitoring profiler slot), so if another job is
+    being profiled this one runs unprofiled and no stats are written.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        logger.warning("Another job is being profiled, running this job unprofiled")
+        return func(body)
+
+    try:
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, body)
+        finally:
+            profiler.dump_stats(filename)
+            summary = io.StringIO()
+            stats = pstats.Stats(profiler, stream=summary)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(lines)
+            logger.info(f"Profile written to {filename}\n{summary.getvalue()}")
+    finally:
+        _profile_lock.release()
+
 
 def _rabbitmq_connect(node_id, worker_name, host, port, user, password, ssl_options):
     client_properties = {
@@ -306,15 +647,93 @@ def _rabbitmq_ack_message(ch, delivery_tag):
         logger.error("Channel is closed, cannot ack message")
 
 
-def _rabbitmq_queue_message(ch, exchange, routing_key, body):
+def _rabbitmq_nack_message(ch, delivery_tag):
+    """Reject a message so the broker redelivers it, `ch` must be the
+    channel the message was received on.
+    """
+    if ch.is_open:
+        logger.info("Requeueing message %s", delivery_tag)
+        ch.basic_nack(delivery_tag, requeue=True)
+    else:
+        logger.error("Channel is closed, cannot nack message")
+
+
+def _encode_body(
+    body,
+    threshold=RABBIT_COMPRESSION_THRESHOLD_BYTES,
+    content_encoding=RABBIT_DEFAULT_CONTENT_ENCODING,
+):
+    """Compress a message body above the threshold with gzip or zstd,
+    returning the body to publish and its content encoding (None if left
+    uncompressed). A content_encoding of None never compresses.
+    """
+    if isinstance(body, str):
+        body = body.encode()
+
+    if content_encoding is None or len(body) < threshold:
+        return body, None
+
+    start = time.perf_counter()
+    if content_encoding == "zstd":
+        compressed = zstandard.ZstdCompressor().compress(body)
+    else:
+        compressed = gzip.compress(body, compresslevel=6)
+    elapsed = time.perf_counter() - start
+
+    if len(compressed) >= len(body):
+        return body, None
+
+    logger.info(
+        "Compressed message body %i -> %i bytes (ratio %.1f, %s) in %.1f ms",
+        len(body),
+        len(compressed),
+        len(body) / len(compressed),
+        content_encoding,
+        elapsed * 1000,
+    )
+    return compressed, content_encoding
+
+
+def _decode_body(body, content_encoding):
+    """Decompress a message body according to its content encoding.
+    Bodies without a content encoding are returned unchanged.
+    """
+    if content_encoding is None:
+        return body
+
+    start = time.perf_counter()
+    if content_encoding == "gzip":
+        decompressed = gzip.decompress(body)
+    elif content_encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Received a zstd message but zstandard is not installed")
+        decompressed = zstandard.ZstdDecompressor().decompress(body)
+    else:
+        raise ValueError(f"Unsupported message content encoding {content_encoding}")
+
+    logger.info(
+        "Decompressed message body %i -> %i bytes (%s) in %.1f ms",
+        len(body),
+        len(decompressed),
+        content_encoding,
+        (time.perf_counter() - start) * 1000,
+    )
+    return decompressed
+
+
+def _rabbitmq_queue_message(
+    ch, exchange, routing_key, body, content_encoding=RABBIT_DEFAULT_CONTENT_ENCODING
+):
     if ch.is_open:
         logger.info(f"Sending {body} to {routing_key}")
+        body, content_encoding = _encode_body(body, content_encoding=content_encoding)
         ch.basic_publish(
             exchange=exchange,
             routing_key=routing_key,
             body=body,
             properties=pika.BasicProperties(
                 delivery_mode=2,  # make message persistent
+                content_encoding=content_encoding,
             ),
         )
     else: